@@ -14,8 +14,15 @@ from firebase_admin import credentials, firestore
 firestore_db = None  # Firebase client
 
 
-def create_app(config_class=Config):
-    """Application Factory Pattern"""
+def create_app(config_class=Config, firestore_client=None):
+    """Application Factory Pattern
+
+    Args:
+        config_class: Configuration object to load.
+        firestore_client: Optional Firestore-compatible client. When given, it is
+            used instead of initializing the Firebase Admin SDK (e.g. the
+            in-process stand-in used by the load generator).
+    """
     app = Flask(__name__)
     app.config.from_object(config_class)
 
@@ -38,7 +45,10 @@ def create_app(config_class=Config):
 
     # Initialize Firebase Admin SDK
     global firestore_db
-    if not firebase_admin._apps:  # Check if already initialized
+    if firestore_client is not None:
+        firestore_db = firestore_client
+        app.logger.info("Using provided Firestore client.")
+    elif not firebase_admin._apps:  # Check if already initialized
         try:
             cred_path = app.config.get('FIREBASE_CREDENTIALS_PATH')
             # db_url = app.config.get('FIREBASE_DATABASE_URL') # Removed
@@ -91,6 +101,22 @@ def create_app(config_class=Config):
          supports_credentials=True)
     app.logger.info(f"CORS enabled with origins: {cors_origins}")
 
+    # Admission control for the CPU-bound encoding work
+    from app.scheduler import init_scheduler
+    init_scheduler(app)
+    # Thread pool that overlaps Firestore reads with face encoding
+    from app.firestore_io import init_firestore_io
+    init_firestore_io(app)
+    # Idempotency-Key and pickup debounce reservations for concurrent duplicates
+    from app.idempotency import init_idempotency
+    init_idempotency(app)
+    # Background workers for 202-accepted registrations (job records in Firestore)
+    from app.jobs import init_job_manager
+    init_job_manager(app, firestore_db)
+    # Opt-in sampling profiler for slow requests
+    from app.profiling import init_profiling
+    init_profiling(app)
+
     # Import and register routes (or blueprints)
     with app.app_context():  # Need app context for routes using current_app
         from . import routes
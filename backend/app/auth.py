@@ -0,0 +1,9 @@
+import hmac
+from flask import current_app, request
+
+
+def admin_authorized():
+    """True when the request carries the configured ADMIN_TOKEN as X-Admin-Token."""
+    token = current_app.config.get('ADMIN_TOKEN')
+    supplied = request.headers.get('X-Admin-Token', '')
+    return bool(token) and hmac.compare_digest(supplied, token)
@@ -0,0 +1,40 @@
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from app.models import Guardian
+
+
+def get_io_executor():
+    """Returns the thread pool used to overlap Firestore reads with other work."""
+    return current_app.extensions['firestore_io']
+
+
+def load_guardians(db):
+    """Streams all guardians that have a stored face encoding."""
+    guardians = []
+    for doc in db.collection('guardians').stream():
+        g_data = doc.to_dict()
+        if g_data.get('_face_encoding'):
+            guardians.append(Guardian.from_dict(g_data, doc.id))
+    return guardians
+
+
+def get_documents(db, collection, doc_ids):
+    """Fetches several documents of a collection in one get_all round trip.
+
+    Returns:
+        dict: doc_id -> document snapshot (check .exists for missing documents).
+    """
+    doc_ids = list(dict.fromkeys(doc_ids))
+    if not doc_ids:
+        return {}
+    collection_ref = db.collection(collection)
+    # get_all does not guarantee the order of the snapshots, so key them by id
+    return {doc.id: doc for doc in db.get_all(
+        [collection_ref.document(doc_id) for doc_id in doc_ids])}
+
+
+def init_firestore_io(app):
+    """Creates the app's Firestore read pool from config."""
+    app.extensions['firestore_io'] = ThreadPoolExecutor(
+        max_workers=max(1, app.config.get('FIRESTORE_IO_WORKERS', 16)),
+        thread_name_prefix='firestore-io')
@@ -0,0 +1,271 @@
+import hashlib
+import hmac
+import json
+import os
+import re
+import threading
+from datetime import datetime
+import numpy as np
+from flask import current_app, request
+from app.models import Guardian
+from app.auth import admin_authorized
+
+# Snapshot layout in SNAPSHOT_FOLDER:
+#   gallery_v<N>.f32            raw little-endian float32 encodings, shape (count, 128),
+#                               row i belongs to manifest["guardians"][i] (np.memmap-able)
+#   gallery_v<N>.manifest.json  version, created_at, count, dims, sha256 of the .f32 file
+#                               and per-guardian id, name, student_ids and digest
+#   gallery_delta_<A>_<B>.npz   changes from version A to version B: upserted rows
+#                               (ids, names, student_ids, digests, encodings) and removed_ids
+ENCODING_DIMS = 128
+_MANIFEST_RE = re.compile(r'^gallery_v(\d+)\.manifest\.json$')
+_export_lock = threading.Lock()
+
+
+def gallery_authorized(write=False):
+    """True for the admin X-Admin-Token, or for reads the GALLERY_KIOSK_TOKEN (X-Kiosk-Token)."""
+    if admin_authorized():
+        return True
+    token = current_app.config.get('GALLERY_KIOSK_TOKEN')
+    supplied = request.headers.get('X-Kiosk-Token', '')
+    return not write and bool(token) and hmac.compare_digest(supplied, token)
+
+
+def _row_digest(name, student_ids, encoding):
+    digest = hashlib.sha1()
+    digest.update((name or '').encode('utf-8'))
+    digest.update(json.dumps(sorted(student_ids)).encode('utf-8'))
+    digest.update(encoding.tobytes())
+    return digest.hexdigest()
+
+
+def load_gallery(db):
+    """Reads every guardian with a face encoding from Firestore.
+
+    Returns:
+        tuple: (rows, encodings) where rows is a list of dicts with id, name,
+               student_ids and digest, and encodings a float32 (count, 128) array.
+    """
+    rows = []
+    encodings = []
+    for doc in db.collection('guardians').stream():
+        g_data = doc.to_dict()
+        if not g_data.get('_face_encoding'):
+            continue
+        guardian = Guardian.from_dict(g_data, doc.id)
+        encoding = guardian.face_encoding.astype('<f4')
+        if encoding.shape != (ENCODING_DIMS,):
+            current_app.logger.warning(
+                f"Skipping guardian {guardian.id}: unexpected encoding shape {encoding.shape}")
+            continue
+        rows.append({
+            "id": guardian.id,
+            "name": guardian.name,
+            "student_ids": guardian.student_ids,
+            "digest": _row_digest(guardian.name, guardian.student_ids, encoding)
+        })
+        encodings.append(encoding)
+    # Stable order keeps row indices comparable between versions
+    order = sorted(range(len(rows)), key=lambda i: rows[i]["id"])
+    rows = [rows[i] for i in order]
+    matrix = np.asarray([encodings[i] for i in order], dtype='<f4').reshape(-1, ENCODING_DIMS)
+    return rows, matrix
+
+
+def _snapshot_folder():
+    folder = current_app.config['SNAPSHOT_FOLDER']
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+
+def list_versions():
+    """Returns the snapshot versions present on disk, oldest first."""
+    versions = []
+    for entry in os.listdir(_snapshot_folder()):
+        match = _MANIFEST_RE.match(entry)
+        if match:
+            versions.append(int(match.group(1)))
+    return sorted(versions)
+
+
+def snapshot_paths(version):
+    """Returns (encodings_path, manifest_path) for a snapshot version."""
+    folder = _snapshot_folder()
+    return (os.path.join(folder, f"gallery_v{version}.f32"),
+            os.path.join(folder, f"gallery_v{version}.manifest.json"))
+
+
+def read_manifest(version):
+    """Returns the manifest of a snapshot version, or None if it does not exist."""
+    _, manifest_path = snapshot_paths(version)
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path) as f:
+        return json.load(f)
+
+
+def open_snapshot(version):
+    """Opens a snapshot for matching: (manifest, read-only memmap of the encodings)."""
+    manifest = read_manifest(version)
+    if manifest is None:
+        return None, None
+    encodings_path, _ = snapshot_paths(version)
+    if manifest["count"] == 0:
+        return manifest, np.zeros((0, manifest["dims"]), dtype='<f4')
+    encodings = np.memmap(encodings_path, dtype='<f4', mode='r',
+                          shape=(manifest["count"], manifest["dims"]))
+    return manifest, encodings
+
+
+def export_snapshot(db):
+    """Writes a new snapshot version if the gallery changed since the latest one.
+
+    Exports are serialised in-process, and a version number is claimed by
+    atomically linking its encodings file into place, so concurrent exports
+    (e.g. from several server processes and the CLI) never share a version.
+
+    Returns:
+        tuple: (manifest, created) with the manifest of the new (or unchanged
+               latest) snapshot and whether a new version was written.
+    """
+    with _export_lock:
+        rows, encodings = load_gallery(db)
+        versions = list_versions()
+        if versions:
+            latest = read_manifest(versions[-1])
+            # Same guardians (by id) with the same contents, in the same row order
+            if ([(r["id"], r["digest"]) for r in latest["guardians"]]
+                    == [(r["id"], r["digest"]) for r in rows]):
+                current_app.logger.info(
+                    f"Gallery unchanged since snapshot v{latest['version']}")
+                return latest, False
+
+        data = encodings.tobytes()
+        folder = _snapshot_folder()
+        tmp_path = os.path.join(folder, f".gallery_{os.getpid()}_{threading.get_ident()}.f32.tmp")
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        try:
+            version = versions[-1] + 1 if versions else 1
+            while True:
+                encodings_path, manifest_path = snapshot_paths(version)
+                try:
+                    os.link(tmp_path, encodings_path)  # Fails if the version is taken
+                    break
+                except FileExistsError:
+                    version += 1
+        finally:
+            os.remove(tmp_path)
+
+        manifest = {
+            "version": version,
+            "created_at": datetime.utcnow().isoformat() + "Z",
+            "count": len(rows),
+            "dims": ENCODING_DIMS,
+            "dtype": "float32-le",
+            "encodings_file": os.path.basename(encodings_path),
+            "sha256": hashlib.sha256(data).hexdigest(),
+            "guardians": rows
+        }
+        # Write the manifest last so a listed version is always complete
+        _write_atomic(manifest_path, lambda f: f.write(json.dumps(manifest).encode('utf-8')))
+        current_app.logger.info(
+            f"Exported gallery snapshot v{version} with {len(rows)} guardians")
+        _prune_snapshots()
+        return manifest, True
+
+
+def _write_atomic(path, write):
+    """Writes a file through a temporary file and os.replace, so readers never see it partial."""
+    tmp_path = f"{path}.{os.getpid()}_{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            write(f)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _prune_snapshots():
+    """Keeps only the newest SNAPSHOT_RETENTION versions and their deltas."""
+    keep = current_app.config.get('SNAPSHOT_RETENTION', 20)
+    versions = list_versions()
+    if len(versions) <= keep:
+        return
+    oldest_kept = versions[-keep]
+    folder = _snapshot_folder()
+    for version in versions[:-keep]:
+        for path in snapshot_paths(version):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+    for entry in os.listdir(folder):
+        match = re.match(r'^gallery_delta_(\d+)_(\d+)\.npz$', entry)
+        if match and int(match.group(1)) < oldest_kept:
+            try:
+                os.remove(os.path.join(folder, entry))
+            except OSError:
+                pass
+
+
+def export_delta(since_version, to_version=None):
+    """Writes the changes between two existing snapshot versions.
+
+    No snapshot is created here; new versions come from export_snapshot
+    (POST /gallery/snapshots or the export-gallery CLI command).
+
+    Args:
+        since_version (int): Version the client currently holds.
+        to_version (int, optional): Target version, the latest one by default.
+
+    Returns:
+        tuple: (delta_path, to_version), or (None, None) if either version is
+               unknown (e.g. pruned) and the client must take a full snapshot.
+    """
+    if to_version is None:
+        versions = list_versions()
+        if not versions:
+            return None, None
+        to_version = versions[-1]
+    base_manifest = read_manifest(since_version)
+    manifest, encodings = open_snapshot(to_version)
+    if base_manifest is None or manifest is None or since_version > to_version:
+        return None, None
+    delta_path = os.path.join(_snapshot_folder(),
+                              f"gallery_delta_{since_version}_{to_version}.npz")
+    if os.path.exists(delta_path):
+        return delta_path, to_version
+
+    upserts, upsert_idx, removed_ids = diff_manifests(base_manifest, manifest)
+    _write_atomic(delta_path, lambda f: np.savez(
+        f,
+        from_version=np.int64(since_version),
+        to_version=np.int64(to_version),
+        ids=np.array([r["id"] for r in upserts], dtype=str),
+        names=np.array([r["name"] or '' for r in upserts], dtype=str),
+        student_ids=np.array([json.dumps(r["student_ids"]) for r in upserts], dtype=str),
+        digests=np.array([r["digest"] for r in upserts], dtype=str),
+        encodings=np.asarray(encodings[upsert_idx], dtype='<f4').reshape(-1, ENCODING_DIMS),
+        removed_ids=np.array(removed_ids, dtype=str)))
+    current_app.logger.info(
+        f"Exported gallery delta v{since_version}->v{to_version}: "
+        f"{len(upserts)} upserted, {len(removed_ids)} removed")
+    return delta_path, to_version
+
+
+def diff_manifests(base_manifest, manifest):
+    """Compares two manifests by guardian id and row digest.
+
+    Returns:
+        tuple: (upserts, upsert_idx, removed_ids) with the new or changed rows of
+               `manifest`, their row indices in its encodings file, and the ids
+               only present in `base_manifest`.
+    """
+    base_digests = {r["id"]: r["digest"] for r in base_manifest["guardians"]}
+    upsert_idx = [i for i, r in enumerate(manifest["guardians"])
+                  if base_digests.get(r["id"]) != r["digest"]]
+    current_ids = {r["id"] for r in manifest["guardians"]}
+    removed_ids = [g_id for g_id in base_digests if g_id not in current_ids]
+    return [manifest["guardians"][i] for i in upsert_idx], upsert_idx, removed_ids
@@ -0,0 +1,252 @@
+import functools
+import inspect
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app, request, jsonify, g
+
+
+class TTLCache:
+    """Thread-safe, size-bounded LRU mapping whose entries expire after `ttl` seconds."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)  # Evict least recently used
+
+
+class RequestInProgress(Exception):
+    """Raised when a concurrent request holds a reservation for longer than the wait limit."""
+
+
+class PendingKeys:
+    """Set of keys whose work is in progress; other requests wait until they are released.
+
+    A key is checked and reserved in one step under the condition's lock, so two
+    concurrent requests can never both start the work for the same key.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._pending = set()
+
+    def reserve(self, keys, timeout, select=None):
+        """Waits until none of `keys` is pending, then marks them as pending.
+
+        Args:
+            keys: Keys to reserve.
+            timeout (float): Max seconds to wait for other holders.
+            select: Optional callable run under the lock once the keys are free;
+                it returns the subset of `keys` that still needs the work (e.g.
+                none when a stored result can be replayed) and only those are
+                reserved.
+
+        Returns:
+            set: The keys now reserved by the caller.
+        Raises:
+            RequestInProgress: The keys were still pending after `timeout` seconds.
+        """
+        keys = set(keys)
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self._pending & keys:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise RequestInProgress(
+                        f"{len(self._pending & keys)} key(s) still being processed")
+                self._cond.wait(remaining)
+            if select is not None:
+                keys = set(select())
+            self._pending |= keys
+            return keys
+
+    def release(self, keys):
+        with self._cond:
+            self._pending -= set(keys)
+            self._cond.notify_all()
+
+
+def _cache(name, ttl_setting, default_ttl):
+    """Returns the named cache for the current app, creating it on first use."""
+    caches = current_app.extensions.setdefault('pickup_idempotency', {})
+    if name not in caches:
+        caches[name] = TTLCache(
+            maxsize=current_app.config.get('IDEMPOTENCY_CACHE_SIZE', 1024),
+            ttl=current_app.config.get(ttl_setting, default_ttl))
+    return caches[name]
+
+
+def _pending():
+    return current_app.extensions['pickup_pending']
+
+
+def _wait_seconds():
+    return current_app.config.get('IDEMPOTENCY_WAIT_SECONDS', 60)
+
+
+def get_idempotent_response(key):
+    """Returns the (body, status) stored for an Idempotency-Key, or None."""
+    if not key:
+        return None
+    return _cache('responses', 'IDEMPOTENCY_TTL_SECONDS', 600).get(key)
+
+
+def store_idempotent_response(key, body, status):
+    """Stores a response so a retry with the same Idempotency-Key replays it."""
+    if key:
+        _cache('responses', 'IDEMPOTENCY_TTL_SECONDS', 600).set(key, (body, status))
+
+
+def _claim_idempotency_key(key):
+    """Returns a stored response to replay, or reserves the key and returns None.
+
+    A request arriving while another one with the same key is in flight waits
+    for it and then replays its result.
+    """
+    cached = []
+
+    def select():
+        cached.append(get_idempotent_response(key))
+        return [] if cached[0] else [('key', key)]
+
+    _pending().reserve([('key', key)], _wait_seconds(), select)
+    return cached[0]
+
+
+def idempotent(view):
+    """Makes a verification view honour the Idempotency-Key header.
+
+    Successful (200) responses are stored and replayed to retries with the
+    same key; concurrent duplicates wait for the first request to finish.
+    """
+    def claim():
+        key = request.headers.get('Idempotency-Key')
+        if not key:
+            return None, None
+        try:
+            cached = _claim_idempotency_key(key)
+        except RequestInProgress:
+            current_app.logger.warning(
+                f"Idempotency-Key {key} is still being processed by another request")
+            return key, (jsonify({"error": "A request with this Idempotency-Key is still being processed."}), 409)
+        if cached:
+            current_app.logger.info(
+                f"Replaying stored response for Idempotency-Key {key}")
+            return key, (jsonify(cached[0]), cached[1])
+        return key, None
+
+    def finish(key, rv):
+        response = current_app.make_response(rv)
+        if response.status_code == 200:
+            store_idempotent_response(key, response.get_json(), 200)
+        return response
+
+    if inspect.iscoroutinefunction(view):
+        @functools.wraps(view)
+        async def wrapper(*args, **kwargs):
+            key, replay = claim()
+            if key is None or replay is not None:
+                return replay if replay is not None else await view(*args, **kwargs)
+            try:
+                return finish(key, await view(*args, **kwargs))
+            finally:
+                _pending().release([('key', key)])
+    else:
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            key, replay = claim()
+            if key is None or replay is not None:
+                return replay if replay is not None else view(*args, **kwargs)
+            try:
+                return finish(key, view(*args, **kwargs))
+            finally:
+                _pending().release([('key', key)])
+    return wrapper
+
+
+def reserve_pickups(student_ids_by_guardian):
+    """Returns the recent pickups of (guardian, student) pairs and reserves the others.
+
+    Pairs another request is logging right now are waited for, so their pickups
+    show up as recent instead of being logged twice. The reserved pairs are
+    released by record_pickups, or when the request ends.
+
+    Args:
+        student_ids_by_guardian (dict): guardian_id -> list of student IDs.
+    Returns:
+        dict: guardian_id -> {student_id: {"student": <student info dict>,
+              "pickup_log_time": <ISO string>}} for pairs logged within the
+              debounce window.
+    Raises:
+        RequestInProgress: Another request kept the pairs for too long.
+    """
+    if current_app.config.get('PICKUP_DEBOUNCE_SECONDS', 0) <= 0:
+        return {guardian_id: {} for guardian_id in student_ids_by_guardian}
+    cache = _cache('pickups', 'PICKUP_DEBOUNCE_SECONDS', 0)
+    pairs = {(guardian_id, student_id)
+             for guardian_id, student_ids in student_ids_by_guardian.items()
+             for student_id in student_ids}
+    recent = {}
+
+    def select():
+        for guardian_id, student_ids in student_ids_by_guardian.items():
+            recent[guardian_id] = {}
+            for student_id in student_ids:
+                entry = cache.get((guardian_id, student_id))
+                if entry is not None:
+                    recent[guardian_id][student_id] = entry
+        return {(guardian_id, student_id) for guardian_id, student_id in pairs
+                if student_id not in recent[guardian_id]}
+
+    # All pairs are reserved at once, so requests never hold some while waiting for others
+    reserved = _pending().reserve(pairs, _wait_seconds(), select)
+    if not hasattr(g, '_pickup_reservations'):
+        g._pickup_reservations = set()
+    g._pickup_reservations |= reserved
+    return recent
+
+
+def record_pickups(guardian_id, students_info, pickup_log_time):
+    """Remembers freshly logged pickups so repeats inside the window are not re-logged."""
+    if current_app.config.get('PICKUP_DEBOUNCE_SECONDS', 0) <= 0:
+        return
+    cache = _cache('pickups', 'PICKUP_DEBOUNCE_SECONDS', 0)
+    for student_info in students_info:
+        cache.set((guardian_id, student_info['id']),
+                  {"student": student_info, "pickup_log_time": pickup_log_time})
+    pairs = {(guardian_id, student_info['id']) for student_info in students_info}
+    g._pickup_reservations = getattr(g, '_pickup_reservations', set()) - pairs
+    _pending().release(pairs)
+
+
+def _release_reservations(exc=None):
+    """Releases pairs a request reserved but did not log (errors, missing students)."""
+    pairs = g.pop('_pickup_reservations', None)
+    if pairs:
+        _pending().release(pairs)
+
+
+def init_idempotency(app):
+    """Creates the in-flight registry and releases leftover reservations per request."""
+    app.extensions['pickup_pending'] = PendingKeys()
+    app.teardown_request(_release_reservations)
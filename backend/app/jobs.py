@@ -0,0 +1,120 @@
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from flask import current_app
+
+
+class JobQueueFull(Exception):
+    """Raised when too many jobs are already queued or running."""
+
+
+class JobManager:
+    """Runs request work (e.g. guardian registration) on background workers.
+
+    Job records are kept in the Firestore `jobs` collection, so GET /jobs/<id>
+    answers from any server process, not only the one running the job. Each
+    record carries an `expires_at` timestamp `ttl` seconds after submission;
+    expired jobs are reported as missing, and a Firestore TTL policy on
+    `jobs.expires_at` deletes them. The queue limit is per process, as each
+    process runs its own workers.
+
+    Args:
+        app: The Flask app, used to give each job an app context.
+        db: The Firestore client holding the job records.
+        workers (int): Number of worker threads.
+        max_pending (int): Max queued plus running jobs before JobQueueFull.
+        ttl (float): Seconds a job's status is retained.
+    """
+
+    def __init__(self, app, db, workers, max_pending, ttl):
+        self._app = app
+        self._db = db
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(1, workers), thread_name_prefix='registration-job')
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.max_pending = max_pending
+        self.ttl = ttl
+
+    def _ref(self, job_id):
+        return self._db.collection('jobs').document(job_id)
+
+    def submit(self, func, *args):
+        """Queues func(*args), which must return (response, status); returns the job record."""
+        with self._lock:
+            if self.max_pending and self._pending >= self.max_pending:
+                raise JobQueueFull(f"{self._pending} jobs already pending")
+            self._pending += 1
+        now = datetime.now(timezone.utc)
+        timestamp = now.replace(tzinfo=None).isoformat() + "Z"
+        job = {"id": uuid.uuid4().hex, "status": "queued", "created_at": timestamp,
+               "updated_at": timestamp, "result": None, "http_status": None}
+        try:
+            self._ref(job["id"]).set(dict(job, expires_at=now + timedelta(seconds=self.ttl)))
+        except Exception:
+            with self._lock:
+                self._pending -= 1
+            raise
+        self._executor.submit(self._run, job["id"], func, args)
+        return job
+
+    def _update(self, job_id, **fields):
+        self._ref(job_id).update(
+            dict(fields, updated_at=datetime.utcnow().isoformat() + "Z"))
+
+    def _run(self, job_id, func, args):
+        try:
+            with self._app.app_context():
+                try:
+                    self._update(job_id, status="running")
+                    response, status = func(*args)
+                    fields = {"status": "succeeded" if status < 400 else "failed",
+                              "result": response.get_json(), "http_status": status}
+                except Exception as e:
+                    current_app.logger.error(
+                        f"Job {job_id} failed: {e}", exc_info=True)
+                    fields = {"status": "failed", "http_status": 500,
+                              "result": {"error": "Internal error while processing the job."}}
+                try:
+                    self._update(job_id, **fields)
+                except Exception as e:
+                    current_app.logger.error(
+                        f"Could not store the outcome of job {job_id}: {e}", exc_info=True)
+                    return
+                current_app.logger.info(
+                    f"Job {job_id} finished with status {fields['status']} ({fields['http_status']})")
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def get(self, job_id):
+        """Returns the job record, or None if unknown or expired."""
+        doc = self._ref(job_id).get()
+        if not doc.exists:
+            return None
+        job = doc.to_dict()
+        if job.pop("expires_at") <= datetime.now(timezone.utc):
+            return None
+        return job
+
+
+def get_job_manager():
+    """Returns the background job manager of the current app."""
+    return current_app.extensions['job_manager']
+
+
+def init_job_manager(app, db):
+    """Creates the app's background job manager from config, storing jobs in `db`."""
+    app.extensions['job_manager'] = JobManager(
+        app, db,
+        workers=app.config.get('REGISTRATION_JOB_WORKERS', 2),
+        max_pending=app.config.get('REGISTRATION_JOB_MAX_PENDING', 100),
+        ttl=app.config.get('JOB_RETENTION_SECONDS', 3600))
+
+
+def prefers_async(request):
+    """True when the client asked for a 202 + job response (Prefer: respond-async or ?async=1)."""
+    if 'respond-async' in request.headers.get('Prefer', ''):
+        return True
+    return request.args.get('async', '').lower() in ('1', 'true', 'yes')
@@ -0,0 +1,161 @@
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from flask import current_app, request, g
+from app.auth import admin_authorized
+
+# Profiles are written as flamegraph-compatible collapsed stacks
+# ("root;caller;callee <samples>" per line), one file per request:
+#   <epoch_ms>_<endpoint>_<duration>ms_<reason>.collapsed
+_PROFILE_RE = re.compile(
+    r'^(?P<ts>\d+)_(?P<endpoint>[\w.]+)_(?P<duration>\d+)ms_(?P<reason>\w+)\.collapsed$')
+
+
+class StackSampler:
+    """Samples the Python stacks of watched threads at a fixed interval.
+
+    A single daemon thread serves all in-flight requests, so the cost per
+    request is one dictionary entry plus the stack walks while it runs.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._watched = {}  # thread ident -> Counter of collapsed stacks
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def watch(self, ident):
+        with self._lock:
+            self._watched[ident] = Counter()
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._loop, name='profile-sampler', daemon=True)
+                self._thread.start()
+
+    def unwatch(self, ident):
+        with self._lock:
+            return self._watched.pop(ident, Counter())
+
+    def _loop(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._watched:
+                    continue
+                frames = sys._current_frames()
+                for ident, counter in self._watched.items():
+                    frame = frames.get(ident)
+                    if frame is not None:
+                        counter[_collapse(frame)] += 1
+
+
+def _collapse(frame):
+    """Formats a frame's stack root-first, as used by flamegraph tools."""
+    parts = []
+    while frame is not None:
+        code = frame.f_code
+        parts.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ';'.join(reversed(parts))
+
+
+def _profile_folder():
+    folder = current_app.config['PROFILING_FOLDER']
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+
+def _start_profile():
+    if request.path.startswith('/admin/profiles'):
+        return
+    config = current_app.config
+    forced = request.headers.get('X-Profile') == '1' and admin_authorized()
+    if not (config.get('PROFILING_ENABLED') or forced):
+        return
+    # Every request is watched so slow ones can still be kept after the fact
+    g._profile = {"start": time.perf_counter(), "forced": forced,
+                  "ident": threading.get_ident()}
+    current_app.extensions['profile_sampler'].watch(g._profile["ident"])
+
+
+def _finish_profile(exc=None):
+    profile = g.pop('_profile', None)
+    if profile is None:
+        return
+    stacks = current_app.extensions['profile_sampler'].unwatch(profile["ident"])
+    duration_ms = int((time.perf_counter() - profile["start"]) * 1000)
+
+    config = current_app.config
+    if profile["forced"]:
+        reason = 'admin'
+    elif duration_ms >= config.get('PROFILING_SLOW_THRESHOLD_MS', 2000):
+        reason = 'slow'
+    elif random.random() < config.get('PROFILING_SAMPLE_RATE', 0.0):
+        reason = 'sampled'
+    else:
+        return
+    if not stacks:
+        return
+
+    endpoint = (request.endpoint or 'unknown').replace('.', '_')
+    name = f"{int(time.time() * 1000)}_{endpoint}_{duration_ms}ms_{reason}.collapsed"
+    try:
+        folder = _profile_folder()
+        with open(os.path.join(folder, name), 'w') as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        _prune_profiles(folder)
+        current_app.logger.info(
+            f"Stored {reason} profile for {request.path} ({duration_ms} ms): {name}")
+    except OSError as e:
+        current_app.logger.error(f"Failed to store profile {name}: {e}")
+
+
+def _prune_profiles(folder):
+    """Keeps the newest PROFILING_MAX_FILES profiles (the on-disk ring)."""
+    keep = current_app.config.get('PROFILING_MAX_FILES', 50)
+    profiles = sorted(entry for entry in os.listdir(folder) if _PROFILE_RE.match(entry))
+    for entry in profiles[:-keep] if keep else profiles:
+        try:
+            os.remove(os.path.join(folder, entry))
+        except OSError:
+            pass
+
+
+def list_profiles():
+    """Returns metadata of the stored profiles, newest first."""
+    folder = _profile_folder()
+    profiles = []
+    for entry in sorted(os.listdir(folder), reverse=True):
+        match = _PROFILE_RE.match(entry)
+        if not match:
+            continue
+        profiles.append({
+            "name": entry,
+            "endpoint": match.group('endpoint'),
+            "duration_ms": int(match.group('duration')),
+            "reason": match.group('reason'),
+            "created_at": int(match.group('ts')) / 1000.0,
+            "size": os.path.getsize(os.path.join(folder, entry))
+        })
+    return profiles
+
+
+def profile_path(name):
+    """Returns the path of a stored profile, or None for unknown names."""
+    if not _PROFILE_RE.match(name):
+        return None
+    path = os.path.join(_profile_folder(), name)
+    return path if os.path.exists(path) else None
+
+
+def init_profiling(app):
+    """Registers the request hooks of the sampling profiler."""
+    app.extensions['profile_sampler'] = StackSampler(
+        app.config.get('PROFILING_INTERVAL_MS', 5) / 1000.0)
+    app.before_request(_start_profile)
+    app.teardown_request(_finish_profile)
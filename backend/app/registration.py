@@ -0,0 +1,199 @@
+import os
+import json
+from flask import jsonify, current_app
+from app import firestore_db  # Set by create_app before the views import this module
+from google.cloud.firestore import ArrayUnion
+from app.models import Guardian, Student
+from app.utils import get_face_encoding, FaceQualityError
+from app.scheduler import get_scheduler, current_kiosk_id, SchedulerBusy, PRIORITY_REGISTER
+from app.jobs import get_job_manager, JobQueueFull
+from app.firestore_io import get_io_executor, get_documents
+
+
+def submit_registration_job(full_path, relative_path, name, student_ids_str, filename):
+    """Queues process_registration on a background worker and returns the 202 response.
+
+    Returns:
+        tuple: (JSON response, HTTP status code), 202 with the job's status URL,
+               503 when the job queue is full, or 500 if the job could not be stored.
+    """
+    try:
+        job = get_job_manager().submit(
+            process_registration, full_path, relative_path, name,
+            student_ids_str, filename, current_kiosk_id())
+    except JobQueueFull as e:
+        current_app.logger.warning(f"Register guardian failed: {e}")
+        try:
+            os.remove(full_path)
+        except OSError:
+            pass
+        return jsonify({"error": "Server is busy, please try again shortly."}), 503
+    except Exception as e:
+        current_app.logger.error(
+            f"Database error while queueing registration for {name}: {e}", exc_info=True)
+        try:
+            os.remove(full_path)
+        except OSError:
+            pass
+        return jsonify({"error": "Database error occurred during registration."}), 500
+    current_app.logger.info(
+        f"Registration for {name} queued as job {job['id']}")
+    response = jsonify({"job_id": job["id"], "status": job["status"],
+                        "status_url": f"/jobs/{job['id']}"})
+    response.headers['Location'] = f"/jobs/{job['id']}"
+    return response, 202  # Accepted
+
+
+def process_registration(full_path, relative_path, name, student_ids_str, filename, kiosk_id):
+    """Encodes a saved reference image and stores the new guardian.
+
+    Runs inside the request for synchronous registrations and on a job worker
+    (with an app context) for asynchronous ones.
+
+    Returns:
+        tuple: (JSON response, HTTP status code)
+    """
+    # The duplicate-path query and the student lookups run on the I/O pool
+    # while this thread encodes the face
+    student_ids_str_list = [
+        id_str.strip() for id_str in student_ids_str.split(',') if id_str.strip()]
+    executor = get_io_executor()
+    duplicates_future = executor.submit(
+        lambda: list(firestore_db.collection('guardians').where(
+            'reference_image_path', '==', relative_path).limit(1).stream()))
+    students_future = executor.submit(
+        get_documents, firestore_db, 'students', student_ids_str_list)
+
+    try:
+        face_encoding = get_scheduler().run(
+            PRIORITY_REGISTER, kiosk_id, get_face_encoding, full_path)
+    except FaceQualityError as e:
+        try:
+            os.remove(full_path)
+        except OSError as e_os:
+            current_app.logger.error(
+                f"Error removing file {full_path} after quality rejection: {e_os}")
+        return jsonify({"error": str(e), "reason": e.reason}), 422
+    except SchedulerBusy as e:
+        current_app.logger.warning(f"Register guardian failed: {e}")
+        try:
+            os.remove(full_path)
+        except OSError:
+            pass
+        return jsonify({"error": "Server is busy, please try again shortly."}), 503
+    if face_encoding is None:
+        current_app.logger.warning(
+            f"Register guardian failed: No face detected or encoding error for {full_path}")
+        try:
+            os.remove(full_path)
+            current_app.logger.info(
+                f"Removed file after failed encoding: {full_path}")
+        except OSError as e:
+            current_app.logger.error(
+                f"Error removing file {full_path} after failed encoding: {e}")
+        return jsonify({"error": "Could not detect a face in the provided image or processing failed."}), 400
+
+    # --- Check for existing guardian with same image path --- # Firestore query will be different
+    # existing_guardian = Guardian.query.filter_by( # Removed SQLAlchemy query
+    #     reference_image_path=relative_path).first()
+    results = duplicates_future.result()
+    existing_guardian_doc = results[0] if results else None
+
+    if existing_guardian_doc:
+        current_app.logger.warning(
+            f"Register guardian conflict: Image path {relative_path} already exists.")
+        try:
+            os.remove(full_path)
+        except OSError as e:
+            current_app.logger.error(
+                f"Error removing duplicate file {full_path}: {e}")
+        return jsonify({"error": f"An image with this filename ({filename}) already exists as a reference."}), 409
+
+    # --- Parse and validate student IDs ---
+    if not student_ids_str_list:
+        current_app.logger.warning(
+            f"Register guardian failed: Invalid student IDs format '{student_ids_str}'. Error: No valid student IDs provided.")
+        try:
+            os.remove(full_path)
+        except OSError:
+            pass
+        return jsonify({"error": "Invalid Student IDs format. Please provide comma-separated integers."}), 400
+
+    # --- Find associated students --- # Firestore query will be different
+    # students = Student.query.filter(Student.id.in_(student_ids)).all() # Removed SQLAlchemy query
+    # All students were fetched in one get_all round trip (see students_future)
+    student_docs = students_future.result()
+    found_students = []
+    missing_ids = []
+    for s_id_str in student_ids_str_list:
+        student_doc = student_docs.get(s_id_str)
+        if student_doc is not None and student_doc.exists:
+            found_students.append(Student.from_dict(
+                student_doc.to_dict(), student_doc.id))
+        else:
+            missing_ids.append(s_id_str)
+
+    if missing_ids:
+        current_app.logger.warning(
+            f"Register guardian failed: Could not find students with IDs: {missing_ids}")
+        try:
+            os.remove(full_path)
+        except OSError:
+            pass
+        return jsonify({"error": f"Could not find students with IDs: {missing_ids}"}), 404
+
+    # --- Create and save the new guardian --- # Firestore operations
+    try:
+        guardian = Guardian(
+            name=name,
+            reference_image_path=relative_path,
+            face_encoding_str=json.dumps(face_encoding.tolist(
+            )) if face_encoding is not None else None,  # Store as JSON string
+            # Store list of student document IDs
+            student_ids=[s.id for s in found_students]
+        )
+        # Add students to the guardian # This relationship is now stored in guardian.student_ids and student.guardian_ids
+        # for student in students: # Removed
+        #     guardian.students.append(student) # Removed
+
+        # db.session.add(guardian) # Removed SQLAlchemy
+        # db.session.commit() # Removed SQLAlchemy
+
+        # Add guardian to Firestore
+        # Firestore auto-generates an ID if document_id is not provided to .document()
+        guardian_doc_ref = firestore_db.collection('guardians').document()
+        guardian.id = guardian_doc_ref.id  # Assign the auto-generated ID to the object
+
+        # The guardian and the students' back-references are written in one batch
+        batch = firestore_db.batch()
+        batch.set(guardian_doc_ref, guardian.to_dict())
+        for student_obj in found_students:
+            student_doc_ref = firestore_db.collection(
+                'students').document(student_obj.id)
+            # Atomically add the new guardian's ID to the student's guardian_ids list
+            batch.update(student_doc_ref,
+                         {'guardian_ids': ArrayUnion([guardian.id])})
+        batch.commit()
+
+        current_app.logger.info(f"Successfully registered guardian ID {guardian.id} ({guardian.name}) "
+                                f"associated with students {[s.id for s in found_students]}")
+
+        return jsonify({
+            "message": "Guardian registered successfully",
+            "guardian_id": guardian.id,
+            "name": guardian.name,
+            "students_associated": [{"id": s.id, "name": s.name} for s in found_students]
+        }), 201  # Created
+
+    except Exception as e:
+        # db.session.rollback() # Removed SQLAlchemy
+        current_app.logger.error(
+            f"Error during guardian registration: {e}", exc_info=True)
+        try:
+            os.remove(full_path)
+            current_app.logger.info(
+                f"Removed file {full_path} after DB error.")
+        except OSError as e_os:
+            current_app.logger.error(
+                f"Error removing file {full_path} after DB error: {e_os}")
+        return jsonify({"error": "Database error occurred during registration."}), 500
@@ -1,11 +1,20 @@
-from flask import request, jsonify, current_app
+from flask import request, jsonify, current_app, send_file
 # from app import db # Removed SQLAlchemy
 from app import firestore_db  # Added Firestore client
 from google.cloud.firestore import ArrayUnion  # Changed to this import
-from app.models import Guardian, Student, PickupLog
-from app.utils import save_uploaded_file, get_face_encoding, compare_faces
+from app.models import Student, PickupLog
+from app.utils import save_uploaded_file, get_face_encoding, compare_faces, FaceQualityError, \
+    get_face_encodings, match_faces, needs_cnn_refinement, refine_ambiguous_encoding, get_cascade_stats
+from app.scheduler import get_scheduler, current_kiosk_id, SchedulerBusy, PRIORITY_VERIFY
+from app.gallery import export_snapshot, export_delta, list_versions, read_manifest, snapshot_paths, \
+    gallery_authorized
+from app.jobs import get_job_manager, prefers_async
+from app.registration import process_registration, submit_registration_job
+from app.firestore_io import get_io_executor, load_guardians, get_documents
+from app.auth import admin_authorized
+from app.profiling import list_profiles, profile_path
+from app.idempotency import idempotent, reserve_pickups, record_pickups, RequestInProgress
 import os
-import json
 from datetime import datetime
 
 
@@ -18,9 +27,16 @@ def index():
         "endpoints": [
             "/register_guardian",
             "/verify_pickup",
+            "/verify_pickup_multi",
             "/add_student",
             "/students",
-            "/guardians"
+            "/guardians",
+            "/scheduler/metrics",
+            "/cascade/metrics",
+            "/gallery/snapshots",
+            "/gallery/delta",
+            "/jobs/<job_id>",
+            "/admin/profiles"
         ]
     })
 
@@ -62,135 +78,17 @@ def register_guardian():
             "Register guardian failed: File save failed or type not allowed")
         return jsonify({"error": "File type not allowed or save failed"}), 400
 
-    face_encoding = get_face_encoding(full_path)
-    if face_encoding is None:
-        current_app.logger.warning(
-            f"Register guardian failed: No face detected or encoding error for {full_path}")
-        try:
-            os.remove(full_path)
-            current_app.logger.info(
-                f"Removed file after failed encoding: {full_path}")
-        except OSError as e:
-            current_app.logger.error(
-                f"Error removing file {full_path} after failed encoding: {e}")
-        return jsonify({"error": "Could not detect a face in the provided image or processing failed."}), 400
-
-    # --- Check for existing guardian with same image path --- # Firestore query will be different
-    # existing_guardian = Guardian.query.filter_by( # Removed SQLAlchemy query
-    #     reference_image_path=relative_path).first()
-    guardians_ref = firestore_db.collection('guardians')
-    query = guardians_ref.where(
-        'reference_image_path', '==', relative_path).limit(1)
-    results = list(query.stream())
-    existing_guardian_doc = results[0] if results else None
-
-    if existing_guardian_doc:
-        current_app.logger.warning(
-            f"Register guardian conflict: Image path {relative_path} already exists.")
-        try:
-            os.remove(full_path)
-        except OSError as e:
-            current_app.logger.error(
-                f"Error removing duplicate file {full_path}: {e}")
-        return jsonify({"error": f"An image with this filename ({file.filename}) already exists as a reference."}), 409
-
-    # --- Parse and validate student IDs ---
-    student_ids_str_list = []  # Changed to store string IDs for Firestore
-    try:
-        student_ids_str_list = [
-            id_str.strip() for id_str in student_ids_str.split(',') if id_str.strip()]
-        if not student_ids_str_list:
-            raise ValueError("No valid student IDs provided.")
-    except ValueError as e:
-        current_app.logger.warning(
-            f"Register guardian failed: Invalid student IDs format '{student_ids_str}'. Error: {e}")
-        try:
-            os.remove(full_path)
-        except OSError:
-            pass
-        return jsonify({"error": "Invalid Student IDs format. Please provide comma-separated integers."}), 400
-
-    # --- Find associated students --- # Firestore query will be different
-    # students = Student.query.filter(Student.id.in_(student_ids)).all() # Removed SQLAlchemy query
-    students_ref = firestore_db.collection('students')
-    found_students = []
-    missing_ids = []
-    # Firestore does not have an 'IN' query for more than 10 items directly in the python client like SQLAlchemy.
-    # We will fetch each student document individually or adjust if this becomes a performance bottleneck.
-    # For now, assuming student_ids_str_list is not excessively long.
-    for s_id_str in student_ids_str_list:
-        student_doc = students_ref.document(s_id_str).get()
-        if student_doc.exists:
-            found_students.append(Student.from_dict(
-                student_doc.to_dict(), student_doc.id))
-        else:
-            missing_ids.append(s_id_str)
-
-    if missing_ids:
-        current_app.logger.warning(
-            f"Register guardian failed: Could not find students with IDs: {missing_ids}")
-        try:
-            os.remove(full_path)
-        except OSError:
-            pass
-        return jsonify({"error": f"Could not find students with IDs: {missing_ids}"}), 404
-
-    # --- Create and save the new guardian --- # Firestore operations
-    try:
-        guardian = Guardian(
-            name=name,
-            reference_image_path=relative_path,
-            face_encoding_str=json.dumps(face_encoding.tolist(
-            )) if face_encoding is not None else None,  # Store as JSON string
-            # Store list of student document IDs
-            student_ids=[s.id for s in found_students]
-        )
-        # Add students to the guardian # This relationship is now stored in guardian.student_ids and student.guardian_ids
-        # for student in students: # Removed
-        #     guardian.students.append(student) # Removed
-
-        # db.session.add(guardian) # Removed SQLAlchemy
-        # db.session.commit() # Removed SQLAlchemy
-
-        # Add guardian to Firestore
-        # Firestore auto-generates an ID if document_id is not provided to .document()
-        guardian_doc_ref = firestore_db.collection('guardians').document()
-        guardian.id = guardian_doc_ref.id  # Assign the auto-generated ID to the object
-        guardian_doc_ref.set(guardian.to_dict())
-
-        # Update students with this guardian's ID
-        for student_obj in found_students:
-            student_doc_ref = firestore_db.collection(
-                'students').document(student_obj.id)
-            # Atomically add the new guardian's ID to the student's guardian_ids list
-            student_doc_ref.update(
-                {'guardian_ids': ArrayUnion([guardian.id])})
-
-        current_app.logger.info(f"Successfully registered guardian ID {guardian.id} ({guardian.name}) "
-                                f"associated with students {[s.id for s in found_students]}")
+    if prefers_async(request):
+        # Accept now; the encoding and Firestore work run on a background worker
+        return submit_registration_job(full_path, relative_path, name,
+                                       student_ids_str, file.filename)
 
-        return jsonify({
-            "message": "Guardian registered successfully",
-            "guardian_id": guardian.id,
-            "name": guardian.name,
-            "students_associated": [{"id": s.id, "name": s.name} for s in found_students]
-        }), 201  # Created
-
-    except Exception as e:
-        # db.session.rollback() # Removed SQLAlchemy
-        current_app.logger.error(
-            f"Error during guardian registration: {e}", exc_info=True)
-        try:
-            os.remove(full_path)
-            current_app.logger.info(
-                f"Removed file {full_path} after DB error.")
-        except OSError as e_os:
-            current_app.logger.error(
-                f"Error removing file {full_path} after DB error: {e_os}")
-        return jsonify({"error": "Database error occurred during registration."}), 500
+    return process_registration(full_path, relative_path, name,
+                                student_ids_str, file.filename, current_kiosk_id())
 
 
 @current_app.route('/verify_pickup', methods=['POST'])
+@idempotent
 def verify_pickup():
     """Verify a guardian's identity and log student pickups."""
     current_app.logger.info("Received request to /verify_pickup")
@@ -213,25 +111,31 @@ def verify_pickup():
             "Verify pickup failed: File save failed or type not allowed")
         return jsonify({"error": "File type not allowed or save failed"}), 400
 
-    unknown_encoding = get_face_encoding(full_path)
+    # The guardian gallery streams in on the I/O pool while this thread encodes
+    guardians_future = get_io_executor().submit(load_guardians, firestore_db)
+    try:
+        unknown_encoding, detection = get_scheduler().run(
+            PRIORITY_VERIFY, current_kiosk_id(), get_face_encoding, full_path,
+            with_detection=True)
+    except FaceQualityError as e:
+        return jsonify({"error": str(e), "reason": e.reason}), 422
+    except SchedulerBusy as e:
+        current_app.logger.warning(f"Verify pickup failed: {e}")
+        return jsonify({"error": "Server is busy, please try again shortly."}), 503
     if unknown_encoding is None:
         current_app.logger.warning(
             f"Verify pickup failed: No face detected or encoding error for {full_path}")
         return jsonify({"error": "Could not detect a face in the provided image or processing failed."}), 400
 
     # --- Get all guardians with valid face encodings --- # Firestore query
-    # guardians = Guardian.query.filter( # Removed SQLAlchemy
-    #     Guardian._face_encoding.isnot(None)).all()
-    guardians_ref = firestore_db.collection('guardians')
-    # Firestore doesn't directly support .isnot(None) in the same way.
-    # We fetch all guardians and filter in Python, or structure data to query for existing _face_encoding field.
-    # For simplicity, fetching all and filtering. This could be optimized if needed.
-    all_guardian_docs = guardians_ref.stream()
-    guardians = []
-    for doc in all_guardian_docs:
-        g_data = doc.to_dict()
-        if g_data.get('_face_encoding'):
-            guardians.append(Guardian.from_dict(g_data, doc.id))
+    # Firestore doesn't directly support .isnot(None), so load_guardians fetches
+    # all guardians and filters in Python.
+    try:
+        guardians = guardians_future.result()
+    except Exception as e:
+        current_app.logger.error(
+            f"Error loading guardians for verification: {e}", exc_info=True)
+        return jsonify({"error": "Database error occurred during verification."}), 500
 
     if not guardians:
         current_app.logger.warning(
@@ -240,7 +144,17 @@ def verify_pickup():
 
     # --- Compare with known faces ---
     known_encodings = [g.face_encoding for g in guardians]
-    known_guardian_ids = [g.id for g in guardians]
+
+    # In cascade mode, borderline HOG matches are re-checked with the CNN detector;
+    # only the re-encode itself needs an encoding slot
+    if needs_cnn_refinement(known_encodings, unknown_encoding, detection):
+        try:
+            unknown_encoding = get_scheduler().run(
+                PRIORITY_VERIFY, current_kiosk_id(), refine_ambiguous_encoding,
+                full_path, unknown_encoding, detection)
+        except SchedulerBusy:
+            current_app.logger.warning(
+                "No slot for CNN escalation; keeping HOG encoding")
 
     # Get tolerance from config
     tolerance = current_app.config.get('FACE_RECOGNITION_TOLERANCE', 0.6)
@@ -253,41 +167,58 @@ def verify_pickup():
             f"Verification failed: No match found for image {relative_path}")
         return jsonify({"match": False, "message": "No authorized guardian matched the provided image."}), 401
 
-    # --- Process matched guardian --- # Firestore query
-    first_match_index = match_indices[0]  # Take the first match
-    matched_guardian_id = known_guardian_ids[first_match_index]
-    # matched_guardian = Guardian.query.get(matched_guardian_id) # Removed SQLAlchemy
-    matched_guardian_doc = firestore_db.collection(
-        'guardians').document(matched_guardian_id).get()
-    if not matched_guardian_doc.exists:
-        current_app.logger.error(
-            f"Matched guardian ID {matched_guardian_id} not found in Firestore.")
-        return jsonify({"error": "Matched guardian data not found."}), 500
-    matched_guardian = Guardian.from_dict(
-        matched_guardian_doc.to_dict(), matched_guardian_doc.id)
+    # --- Process matched guardian ---
+    # The gallery was just streamed, so the matched guardian is not re-fetched
+    matched_guardian = guardians[match_indices[0]]  # Take the first match
 
     current_app.logger.info(
         f"Verification successful: Matched guardian ID {matched_guardian.id} ({matched_guardian.name})")
 
+    # --- Debounce repeat matches: skip students already logged in the window ---
+    try:
+        recent = reserve_pickups(
+            {matched_guardian.id: matched_guardian.student_ids})[matched_guardian.id]
+    except RequestInProgress as e:
+        current_app.logger.warning(
+            f"Pickup for guardian {matched_guardian.id} still being logged by another request: {e}")
+        return jsonify({"error": "This pickup is already being processed, please try again shortly."}), 409
+    if recent and set(recent) >= set(matched_guardian.student_ids):
+        current_app.logger.info(
+            f"Duplicate pickup for guardian {matched_guardian.id} within debounce window; not logging again")
+        response_body = {
+            "match": True,
+            "guardian_id": matched_guardian.id,
+            "guardian_name": matched_guardian.name,
+            "authorized_students": [recent[s_id]["student"] for s_id in matched_guardian.student_ids],
+            "pickup_log_time": min(e["pickup_log_time"] for e in recent.values()),
+            "duplicate": True
+        }
+        return jsonify(response_body), 200
+
     # --- Log pickup for all associated students --- # Firestore operations
     students_authorized = []
+    newly_logged = []
     log_entries_data = []  # Store dicts for Firestore batch
     pickup_timestamp = datetime.utcnow()
 
     try:
-        # Fetch students associated with the guardian
-        # This requires fetching student details based on matched_guardian.student_ids
+        # Fetch the guardian's students (all in one round trip)
         students_to_log = []
-        if matched_guardian.student_ids:
-            students_ref = firestore_db.collection('students')
-            for student_id_str in matched_guardian.student_ids:
-                s_doc = students_ref.document(student_id_str).get()
-                if s_doc.exists:
-                    students_to_log.append(
-                        Student.from_dict(s_doc.to_dict(), s_doc.id))
-                else:
-                    current_app.logger.warning(
-                        f"Student ID {student_id_str} for guardian {matched_guardian.id} not found.")
+        student_docs = get_documents(
+            firestore_db, 'students',
+            [s_id for s_id in matched_guardian.student_ids if s_id not in recent])
+        for student_id_str in matched_guardian.student_ids:
+            if student_id_str in recent:
+                # Logged moments ago; report it without another write
+                students_authorized.append(recent[student_id_str]["student"])
+                continue
+            s_doc = student_docs.get(student_id_str)
+            if s_doc is not None and s_doc.exists:
+                students_to_log.append(
+                    Student.from_dict(s_doc.to_dict(), s_doc.id))
+            else:
+                current_app.logger.warning(
+                    f"Student ID {student_id_str} for guardian {matched_guardian.id} not found.")
 
         batch = firestore_db.batch()  # Use a batch for atomic writes
         pickup_logs_ref = firestore_db.collection('pickuplogs')
@@ -305,11 +236,13 @@ def verify_pickup():
             batch.set(log_doc_ref, log_entry.to_dict())
             log_entries_data.append(log_entry.to_dict())  # For response
 
-            students_authorized.append({
+            student_info = {
                 "id": student_obj.id,
                 "name": student_obj.name,
                 "teacher_email": student_obj.teacher_email
-            })
+            }
+            students_authorized.append(student_info)
+            newly_logged.append(student_info)
 
         # db.session.commit() # Removed SQLAlchemy
         batch.commit()  # Commit all log entries
@@ -318,7 +251,7 @@ def verify_pickup():
             f"Pickup logged for guardian {matched_guardian.id} and students {[s['id'] for s in students_authorized]}")
 
         # --- Simulate teacher notifications ---
-        for student_info in students_authorized:
+        for student_info in newly_logged:
             if student_info.get('teacher_email'):
                 current_app.logger.info(
                     f"NOTIFICATION: Send email to {student_info['teacher_email']} for pickup of {student_info['name']} by {matched_guardian.name}")
@@ -328,14 +261,16 @@ def verify_pickup():
 
         # ISO 8601 format for timestamp
         pickup_time = pickup_timestamp.isoformat() + "Z"
+        record_pickups(matched_guardian.id, newly_logged, pickup_time)
 
-        return jsonify({
+        response_body = {
             "match": True,
             "guardian_id": matched_guardian.id,
             "guardian_name": matched_guardian.name,
             "authorized_students": students_authorized,
             "pickup_log_time": pickup_time
-        }), 200
+        }
+        return jsonify(response_body), 200
 
     except Exception as e:
         # db.session.rollback() # Removed SQLAlchemy
@@ -344,6 +279,183 @@ def verify_pickup():
         return jsonify({"error": "Database error occurred during pickup logging."}), 500
 
 
+@current_app.route('/verify_pickup_multi', methods=['POST'])
+@idempotent
+def verify_pickup_multi():
+    """Verify every guardian visible in one frame and log their student pickups."""
+    current_app.logger.info("Received request to /verify_pickup_multi")
+
+    # --- Input Validation ---
+    if 'image' not in request.files:
+        current_app.logger.warning(
+            "Multi verify failed: No image file provided")
+        return jsonify({"error": "No image file provided"}), 400
+
+    file = request.files['image']
+    if file.filename == '':
+        current_app.logger.warning("Multi verify failed: No selected file")
+        return jsonify({"error": "No selected file"}), 400
+
+    relative_path, full_path = save_uploaded_file(file, 'verified')
+    if not relative_path:
+        current_app.logger.error(
+            "Multi verify failed: File save failed or type not allowed")
+        return jsonify({"error": "File type not allowed or save failed"}), 400
+
+    # --- Encode every face in the frame, with the gallery streaming in alongside ---
+    guardians_future = get_io_executor().submit(load_guardians, firestore_db)
+    try:
+        faces = get_scheduler().run(
+            PRIORITY_VERIFY, current_kiosk_id(), get_face_encodings, full_path)
+    except SchedulerBusy as e:
+        current_app.logger.warning(f"Multi verify failed: {e}")
+        return jsonify({"error": "Server is busy, please try again shortly."}), 503
+    if faces is None:
+        return jsonify({"error": "Could not process the provided image."}), 400
+    if not faces:
+        current_app.logger.warning(
+            f"Multi verify failed: No face detected in {full_path}")
+        return jsonify({"error": "Could not detect a face in the provided image."}), 400
+    if all(face["reason"] for face in faces):
+        current_app.logger.warning(
+            f"Multi verify failed: No face passed the quality checks in {full_path}")
+        return jsonify({
+            "error": "No face in the image passed the quality checks.",
+            "faces": [dict(_face_box(face), reason=face["reason"]) for face in faces]
+        }), 422
+
+    # --- Load the gallery ---
+    try:
+        guardians = guardians_future.result()
+    except Exception as e:
+        current_app.logger.error(
+            f"Error loading guardians for multi verification: {e}", exc_info=True)
+        return jsonify({"error": "Database error occurred during verification."}), 500
+    if not guardians:
+        current_app.logger.warning(
+            "Multi verify failed: No registered guardians with face encodings found.")
+        return jsonify({"error": "No registered guardians with face encodings found in the system."}), 404
+
+    # --- Match all encoded faces in one batch ---
+    encoded = [f for f in faces if f["encoding"] is not None]
+    matches = match_faces([g.face_encoding for g in guardians],
+                          [f["encoding"] for f in encoded])
+    for face, (index, distance) in zip(encoded, matches):
+        face["guardian"] = guardians[index] if index is not None else None
+        face["distance"] = distance
+
+    # --- Log pickups once per matched guardian ---
+    matched = {f["guardian"].id: f["guardian"].student_ids
+               for f in encoded if f["guardian"] is not None}
+    try:
+        recent_by_guardian = reserve_pickups(matched)
+    except RequestInProgress as e:
+        current_app.logger.warning(
+            f"Pickups for guardians {list(matched)} still being logged by another request: {e}")
+        return jsonify({"error": "This pickup is already being processed, please try again shortly."}), 409
+    pickup_timestamp = datetime.utcnow()
+    pickup_time = pickup_timestamp.isoformat() + "Z"
+    students_by_guardian = {}
+    try:
+        batch = firestore_db.batch()
+        pickup_logs_ref = firestore_db.collection('pickuplogs')
+        student_docs = get_documents(
+            firestore_db, 'students',
+            [s_id for g_id, student_ids in matched.items() for s_id in student_ids
+             if s_id not in recent_by_guardian[g_id]])
+        newly_logged = {}
+        log_times = {}  # guardian_id -> (pickup_log_time, duplicate)
+        for face in encoded:
+            guardian = face["guardian"]
+            if guardian is None or guardian.id in students_by_guardian:
+                continue
+            recent = recent_by_guardian[guardian.id]
+            authorized = []
+            newly_logged[guardian.id] = []
+            for student_id_str in guardian.student_ids:
+                if student_id_str in recent:
+                    authorized.append(recent[student_id_str]["student"])
+                    continue
+                s_doc = student_docs.get(student_id_str)
+                if s_doc is None or not s_doc.exists:
+                    current_app.logger.warning(
+                        f"Student ID {student_id_str} for guardian {guardian.id} not found.")
+                    continue
+                student_obj = Student.from_dict(s_doc.to_dict(), s_doc.id)
+                log_entry = PickupLog(
+                    guardian_id=guardian.id,
+                    student_id=student_obj.id,
+                    verified_image_path=relative_path,
+                    timestamp=pickup_timestamp
+                )
+                log_doc_ref = pickup_logs_ref.document()
+                log_entry.id = log_doc_ref.id
+                batch.set(log_doc_ref, log_entry.to_dict())
+                student_info = {
+                    "id": student_obj.id,
+                    "name": student_obj.name,
+                    "teacher_email": student_obj.teacher_email
+                }
+                authorized.append(student_info)
+                newly_logged[guardian.id].append(student_info)
+            students_by_guardian[guardian.id] = authorized
+            if not newly_logged[guardian.id] and recent and set(recent) >= set(guardian.student_ids):
+                # Every student was logged moments ago: report that earlier pickup
+                log_times[guardian.id] = (
+                    min(e["pickup_log_time"] for e in recent.values()), True)
+            else:
+                log_times[guardian.id] = (pickup_time, False)
+
+        if any(newly_logged.values()):
+            batch.commit()
+        for guardian_id, students_info in newly_logged.items():
+            record_pickups(guardian_id, students_info, pickup_time)
+    except Exception as e:
+        current_app.logger.error(
+            f"Database error during multi-face pickup logging: {e}", exc_info=True)
+        return jsonify({"error": "Database error occurred during pickup logging."}), 500
+
+    # --- Per-face results ---
+    results = []
+    for face in faces:
+        result = dict(_face_box(face), match=False)
+        if face["reason"]:
+            result["reason"] = face["reason"]
+        guardian = face.get("guardian")
+        if face.get("distance") is not None:
+            result["distance"] = round(face["distance"], 4)
+        if guardian is not None:
+            result.update({
+                "match": True,
+                "guardian_id": guardian.id,
+                "guardian_name": guardian.name,
+                "authorized_students": students_by_guardian[guardian.id],
+                "pickup_log_time": log_times[guardian.id][0],
+                "duplicate": log_times[guardian.id][1]
+            })
+        results.append(result)
+
+    matched_ids = list(students_by_guardian)
+    current_app.logger.info(
+        f"Multi verify: {len(faces)} face(s), matched guardians {matched_ids}")
+    if not matched_ids:
+        return jsonify({"match": False, "faces": results, "pickup_log_time": None}), 401
+    response_body = {
+        "match": True,
+        "faces": results,
+        # The latest pickup reported, fresh unless every matched guardian was a duplicate
+        "pickup_log_time": max(t for t, _ in log_times.values()),
+        "duplicate": all(duplicate for _, duplicate in log_times.values())
+    }
+    return jsonify(response_body), 200
+
+
+def _face_box(face):
+    """Returns the {"box": ...} entry of a multi-verify face result."""
+    top, right, bottom, left = face["location"]
+    return {"box": {"top": top, "right": right, "bottom": bottom, "left": left}}
+
+
 # === Helper/Management Routes ===
 
 @current_app.route('/add_student', methods=['POST'])
@@ -476,3 +588,134 @@ def get_guardians():
         current_app.logger.error(
             f"Error fetching guardians: {e}", exc_info=True)
         return jsonify({"error": "Failed to retrieve guardians"}), 500
+
+
+@current_app.route('/scheduler/metrics', methods=['GET'])
+def scheduler_metrics():
+    """Return encoding scheduler load and queue-time metrics per priority class."""
+    return jsonify(get_scheduler().metrics()), 200
+
+
+@current_app.route('/cascade/metrics', methods=['GET'])
+def cascade_metrics():
+    """Return how often each HOG/CNN detection cascade path has run."""
+    return jsonify({
+        "model": current_app.config.get('FACE_RECOGNITION_MODEL', 'hog'),
+        "paths": get_cascade_stats()
+    }), 200
+
+
+# === Gallery snapshots for kiosk-side matching ===
+
+@current_app.route('/gallery/snapshots', methods=['POST'])
+def create_gallery_snapshot():
+    """Export the guardian gallery as a new snapshot version if it changed (requires X-Admin-Token).
+
+    Returns 201 with the new version, or 200 with the latest one when nothing changed.
+    """
+    current_app.logger.info("Received request to POST /gallery/snapshots")
+    if not gallery_authorized(write=True):
+        return jsonify({"error": "Admin token required"}), 403
+    try:
+        manifest, created = export_snapshot(firestore_db)
+    except Exception as e:
+        current_app.logger.error(
+            f"Error exporting gallery snapshot: {e}", exc_info=True)
+        return jsonify({"error": "Failed to export gallery snapshot"}), 500
+    body = {key: value for key, value in manifest.items() if key != "guardians"}
+    return jsonify(body), 201 if created else 200
+
+
+@current_app.route('/gallery/snapshots', methods=['GET'])
+def get_gallery_snapshots():
+    """Return the available snapshot versions, newest last (requires a kiosk or admin token)."""
+    if not gallery_authorized():
+        return jsonify({"error": "Kiosk or admin token required"}), 403
+    versions = list_versions()
+    return jsonify({"versions": versions, "latest": versions[-1] if versions else None}), 200
+
+
+@current_app.route('/gallery/snapshots/<int:version>/manifest', methods=['GET'])
+def get_gallery_snapshot_manifest(version):
+    """Return the manifest (guardian rows and checksum) of a snapshot version (requires a kiosk or admin token)."""
+    if not gallery_authorized():
+        return jsonify({"error": "Kiosk or admin token required"}), 403
+    manifest = read_manifest(version)
+    if manifest is None:
+        return jsonify({"error": f"Snapshot version {version} not found"}), 404
+    return jsonify(manifest), 200
+
+
+@current_app.route('/gallery/snapshots/<int:version>/encodings', methods=['GET'])
+def get_gallery_snapshot_encodings(version):
+    """Download the flat float32 encodings file of a snapshot version (requires a kiosk or admin token)."""
+    if not gallery_authorized():
+        return jsonify({"error": "Kiosk or admin token required"}), 403
+    encodings_path, _ = snapshot_paths(version)
+    if read_manifest(version) is None or not os.path.exists(encodings_path):
+        return jsonify({"error": f"Snapshot version {version} not found"}), 404
+    return send_file(encodings_path, mimetype='application/octet-stream',
+                     as_attachment=True, download_name=os.path.basename(encodings_path))
+
+
+@current_app.route('/gallery/delta', methods=['GET'])
+def get_gallery_delta():
+    """Download the changes from ?since=<version> to the latest snapshot as an .npz delta file.
+
+    Only existing snapshot versions are served; new versions are created with
+    POST /gallery/snapshots or the export-gallery CLI command. Requires a kiosk
+    or admin token.
+    """
+    if not gallery_authorized():
+        return jsonify({"error": "Kiosk or admin token required"}), 403
+    since = request.args.get('since', type=int)
+    if since is None:
+        return jsonify({"error": "Query parameter 'since' (snapshot version) is required"}), 400
+    try:
+        delta_path, to_version = export_delta(since)
+    except Exception as e:
+        current_app.logger.error(
+            f"Error exporting gallery delta: {e}", exc_info=True)
+        return jsonify({"error": "Failed to export gallery delta"}), 500
+    if delta_path is None:
+        # Base version unknown or pruned: the kiosk must fetch a full snapshot
+        return jsonify({"error": f"Snapshot version {since} not available, fetch a full snapshot",
+                        "latest": list_versions()[-1] if list_versions() else None}), 410
+    response = send_file(delta_path, mimetype='application/octet-stream',
+                         as_attachment=True, download_name=os.path.basename(delta_path))
+    response.headers['X-Gallery-Version'] = str(to_version)
+    return response
+
+
+@current_app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Return the status (and, once finished, the result) of a background job."""
+    try:
+        job = get_job_manager().get(job_id)
+    except Exception as e:
+        current_app.logger.error(f"Error fetching job {job_id}: {e}", exc_info=True)
+        return jsonify({"error": "Database error occurred while fetching the job."}), 500
+    if job is None:
+        return jsonify({"error": f"Job {job_id} not found or expired"}), 404
+    return jsonify(job), 200
+
+
+# === Admin: stored profiles ===
+
+@current_app.route('/admin/profiles', methods=['GET'])
+def get_profiles():
+    """List stored request profiles (requires X-Admin-Token)."""
+    if not admin_authorized():
+        return jsonify({"error": "Admin token required"}), 403
+    return jsonify(list_profiles()), 200
+
+
+@current_app.route('/admin/profiles/<name>', methods=['GET'])
+def download_profile(name):
+    """Download a stored profile as collapsed stacks (requires X-Admin-Token)."""
+    if not admin_authorized():
+        return jsonify({"error": "Admin token required"}), 403
+    path = profile_path(name)
+    if path is None:
+        return jsonify({"error": f"Profile {name} not found"}), 404
+    return send_file(path, mimetype='text/plain', as_attachment=True, download_name=name)
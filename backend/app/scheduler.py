@@ -0,0 +1,165 @@
+import itertools
+import threading
+import time
+from collections import deque
+from flask import current_app, request
+
+# Priority classes, lower value is served first
+PRIORITY_VERIFY = 0
+PRIORITY_REGISTER = 1
+PRIORITY_MAINTENANCE = 2
+PRIORITY_NAMES = {
+    PRIORITY_VERIFY: 'verify',
+    PRIORITY_REGISTER: 'register',
+    PRIORITY_MAINTENANCE: 'maintenance',
+}
+
+
+class SchedulerBusy(Exception):
+    """Raised when a task waits longer than the queue timeout for a slot."""
+
+
+class EncodingScheduler:
+    """Admission control for CPU-bound face encoding work.
+
+    Registration and maintenance tasks share `workers` slots, and verification
+    may additionally use `reserved_verify` slots on top of them, so at most
+    `workers + reserved_verify` tasks run at once and a verification can always
+    start even while every regular slot is busy. Waiting tasks are admitted by
+    priority class (verify, then register, then maintenance) and FIFO within a
+    class, and each kiosk can hold at most `per_kiosk` running slots so one
+    busy kiosk cannot monopolise the server.
+
+    Args:
+        workers (int): Number of encoding slots shared by all classes.
+        reserved_verify (int): Extra slots only verification requests may use.
+        per_kiosk (int): Max running tasks per kiosk (0 for unlimited).
+        queue_timeout (float): Seconds a task may wait before SchedulerBusy.
+    """
+
+    def __init__(self, workers, reserved_verify=0, per_kiosk=0, queue_timeout=30.0):
+        self.workers = max(1, workers)
+        self.reserved_verify = max(0, reserved_verify)
+        self.per_kiosk = per_kiosk
+        self.queue_timeout = queue_timeout
+        self._cond = threading.Condition()
+        self._counter = itertools.count()
+        self._waiting = []  # (priority, seq, kiosk_id), kept sorted
+        self._running = 0
+        self._running_by_kiosk = {}
+        self._stats = {p: {"admitted": 0, "rejected": 0, "wait_total": 0.0,
+                           "wait_max": 0.0, "recent_waits": deque(maxlen=500)}
+                       for p in PRIORITY_NAMES}
+
+    def _eligible(self, priority, kiosk_id, running):
+        if self.per_kiosk and kiosk_id is not None and \
+                self._running_by_kiosk.get(kiosk_id, 0) >= self.per_kiosk:
+            return False
+        limit = self.workers + self.reserved_verify if priority == PRIORITY_VERIFY \
+            else self.workers
+        return running < limit
+
+    def _next_admissible(self):
+        """The first waiter, in priority order, that may take a free slot now."""
+        for entry in self._waiting:
+            if self._eligible(entry[0], entry[2], self._running):
+                return entry
+        return None
+
+    def acquire(self, priority, kiosk_id=None):
+        """Blocks until a slot is granted; returns the time spent queued."""
+        entry = (priority, next(self._counter), kiosk_id)
+        start = time.monotonic()
+        deadline = start + self.queue_timeout
+        with self._cond:
+            self._waiting.append(entry)
+            self._waiting.sort()
+            try:
+                while self._next_admissible() is not entry:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats[priority]["rejected"] += 1
+                        raise SchedulerBusy(
+                            f"No encoding slot within {self.queue_timeout}s")
+                    self._cond.wait(remaining)
+            finally:
+                self._waiting.remove(entry)
+                # Our departure may make another waiter admissible
+                self._cond.notify_all()
+
+            self._running += 1
+            if kiosk_id is not None:
+                self._running_by_kiosk[kiosk_id] = \
+                    self._running_by_kiosk.get(kiosk_id, 0) + 1
+            waited = time.monotonic() - start
+            stats = self._stats[priority]
+            stats["admitted"] += 1
+            stats["wait_total"] += waited
+            stats["wait_max"] = max(stats["wait_max"], waited)
+            stats["recent_waits"].append(waited)
+            return waited
+
+    def release(self, kiosk_id=None):
+        with self._cond:
+            self._running -= 1
+            if kiosk_id is not None:
+                remaining = self._running_by_kiosk.get(kiosk_id, 1) - 1
+                if remaining > 0:
+                    self._running_by_kiosk[kiosk_id] = remaining
+                else:
+                    self._running_by_kiosk.pop(kiosk_id, None)
+            self._cond.notify_all()
+
+    def run(self, priority, kiosk_id, func, *args, **kwargs):
+        """Runs func(*args, **kwargs) once a slot for `priority` is granted."""
+        self.acquire(priority, kiosk_id)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.release(kiosk_id)
+
+    def metrics(self):
+        """Returns running/queued counts and queue-time stats per priority class."""
+        with self._cond:
+            queued = {name: 0 for name in PRIORITY_NAMES.values()}
+            for priority, _, _ in self._waiting:
+                queued[PRIORITY_NAMES[priority]] += 1
+            classes = {}
+            for priority, stats in self._stats.items():
+                waits = sorted(stats["recent_waits"])
+                classes[PRIORITY_NAMES[priority]] = {
+                    "queued": queued[PRIORITY_NAMES[priority]],
+                    "admitted": stats["admitted"],
+                    "rejected": stats["rejected"],
+                    "wait_avg_ms": round(1000 * stats["wait_total"] / stats["admitted"], 1)
+                    if stats["admitted"] else 0.0,
+                    "wait_p95_ms": round(1000 * waits[int(0.95 * (len(waits) - 1))], 1)
+                    if waits else 0.0,
+                    "wait_max_ms": round(1000 * stats["wait_max"], 1),
+                }
+            return {
+                "workers": self.workers,
+                "reserved_verify": self.reserved_verify,
+                "per_kiosk": self.per_kiosk,
+                "running": self._running,
+                "classes": classes,
+            }
+
+
+def get_scheduler():
+    """Returns the encoding scheduler of the current app."""
+    return current_app.extensions['encoding_scheduler']
+
+
+def init_scheduler(app):
+    """Creates the app's encoding scheduler from config."""
+    app.extensions['encoding_scheduler'] = EncodingScheduler(
+        workers=app.config.get('ENCODING_WORKERS', 2),
+        reserved_verify=app.config.get('ENCODING_RESERVED_VERIFY_SLOTS', 1),
+        per_kiosk=app.config.get('ENCODING_PER_KIOSK_LIMIT', 2),
+        queue_timeout=app.config.get('ENCODING_QUEUE_TIMEOUT', 30.0))
+
+
+def current_kiosk_id():
+    """Identifies the calling kiosk by its X-Kiosk-Id header, else its address."""
+    return request.headers.get('X-Kiosk-Id') or request.remote_addr
@@ -6,6 +6,7 @@ import time  # Import time for timestamp generation
 from werkzeug.utils import secure_filename
 from flask import current_app
 from pathlib import Path
+import threading
 
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg'}
 
@@ -68,22 +69,257 @@ def save_uploaded_file(file, folder_type):
         return None, None
 
 
-def get_face_encoding(image_path):
-    """Loads an image and returns the first face encoding found."""
+class FaceQualityError(Exception):
+    """Raised when a frame fails the quality gate; `reason` is a short code."""
+
+    MESSAGES = {
+        'too_dark': "The image is too dark. Please move to a brighter spot.",
+        'too_bright': "The image is overexposed. Please avoid direct light.",
+        'face_too_small': "The face is too small. Please move closer to the camera.",
+        'too_blurry': "The image is blurry. Please hold still and try again.",
+        'bad_pose': "Please look straight at the camera.",
+    }
+
+    def __init__(self, reason, detail=None):
+        self.reason = reason
+        self.detail = detail
+        super().__init__(self.MESSAGES.get(reason, reason))
+
+
+def _laplacian_variance(gray):
+    """Variance of the 4-neighbour Laplacian, a cheap sharpness measure."""
+    if gray.shape[0] < 3 or gray.shape[1] < 3:
+        return 0.0
+    lap = (gray[:-2, 1:-1] + gray[2:, 1:-1] + gray[1:-1, :-2] + gray[1:-1, 2:]
+           - 4 * gray[1:-1, 1:-1])
+    return float(lap.var())
+
+
+def to_grayscale(image):
+    """Returns the float grayscale version of an RGB (or already gray) image."""
+    return image.mean(axis=2) if image.ndim == 3 else image.astype(np.float32)
+
+
+def check_face_quality(image, gray, face_location):
+    """Checks face box size, exposure, sharpness and pose for a detected face.
+
+    Exposure and sharpness are measured on the face crop, so a backlit face in
+    an otherwise bright frame is still rejected as too dark.
+
+    Args:
+        image (numpy.ndarray): The RGB image.
+        gray (numpy.ndarray): Grayscale version of the image (from to_grayscale).
+        face_location (tuple): (top, right, bottom, left) box from face_recognition.
+
+    Raises:
+        FaceQualityError: With the reason code of the first failed check.
+    """
+    config = current_app.config
+    top, right, bottom, left = face_location
+
+    size = min(bottom - top, right - left)
+    if size < config.get('FACE_QUALITY_MIN_FACE_SIZE', 80):
+        raise FaceQualityError('face_too_small', {"face_size": size})
+
+    crop = gray[max(top, 0):bottom, max(left, 0):right]
+    brightness = float(crop.mean())
+    if brightness < config.get('FACE_QUALITY_MIN_BRIGHTNESS', 40.0):
+        raise FaceQualityError('too_dark', {"brightness": brightness})
+    if brightness > config.get('FACE_QUALITY_MAX_BRIGHTNESS', 220.0):
+        raise FaceQualityError('too_bright', {"brightness": brightness})
+
+    sharpness = _laplacian_variance(crop)
+    if sharpness < config.get('FACE_QUALITY_MIN_SHARPNESS', 40.0):
+        raise FaceQualityError('too_blurry', {"sharpness": sharpness})
+
+    # The 5-point landmark model is cheap compared to the encoder
+    landmarks = face_recognition.face_landmarks(
+        image, [face_location], model='small')
+    if not landmarks:
+        return
+    points = landmarks[0]
+    left_eye = np.mean(points['left_eye'], axis=0)
+    right_eye = np.mean(points['right_eye'], axis=0)
+    nose = np.array(points['nose_tip'][0], dtype=float)
+
+    eye_vector = right_eye - left_eye
+    eye_distance = float(np.linalg.norm(eye_vector))
+    if eye_distance == 0:
+        raise FaceQualityError('bad_pose', {"eye_distance": 0})
+    roll = abs(float(np.degrees(np.arctan2(eye_vector[1], eye_vector[0]))))
+    roll = min(roll, 180.0 - roll)  # eye order does not matter
+    # Nose offset from the eye midpoint along the eye line approximates yaw
+    yaw = abs(float(np.dot(nose - (left_eye + right_eye) / 2,
+                           eye_vector / eye_distance))) / eye_distance
+    if (roll > config.get('FACE_QUALITY_MAX_ROLL', 20.0)
+            or yaw > config.get('FACE_QUALITY_MAX_YAW', 0.35)):
+        raise FaceQualityError('bad_pose', {"yaw": yaw, "roll": roll})
+
+
+_cascade_lock = threading.Lock()
+
+
+def record_cascade_path(path, seconds, replaces=None):
+    """Counts how often each cascade path runs and the time spent detecting on it.
+
+    Each request is counted once, under the last path it took: `replaces` is the
+    detection dict of an earlier run of the same request (see locate_faces), which
+    is moved to `path` instead of counting the request twice.
+    """
+    with _cascade_lock:
+        stats = current_app.extensions.setdefault('face_cascade_stats', {})
+        if replaces is not None:
+            previous = stats[replaces["path"]]
+            previous["count"] -= 1
+            previous["total_seconds"] -= replaces["seconds"]
+            seconds += replaces["seconds"]
+        entry = stats.setdefault(path, {"count": 0, "total_seconds": 0.0})
+        entry["count"] += 1
+        entry["total_seconds"] += seconds
+
+
+def get_cascade_stats():
+    """Returns per-path counts, share of runs and average detection time of the cascade."""
+    with _cascade_lock:
+        stats = current_app.extensions.get('face_cascade_stats', {})
+        total = sum(entry["count"] for entry in stats.values())
+        return {
+            path: {
+                "count": entry["count"],
+                "share": round(entry["count"] / total, 4) if total else 0.0,
+                "avg_ms": round(1000 * entry["total_seconds"] / entry["count"], 1)
+            }
+            for path, entry in stats.items() if entry["count"]
+        }
+
+
+def locate_faces(image, model=None):
+    """Detects face boxes with the configured model.
+
+    With model 'cascade' the fast HOG detector runs first and the CNN detector
+    only when HOG finds nothing.
+
+    Returns:
+        tuple: (face_locations, detection) where detection is a dict with the
+               "path" that produced the boxes ('hog', 'cnn', or in cascade mode
+               'hog' / 'cnn_no_face') and the detection time in "seconds".
+    """
+    model = model or current_app.config.get('FACE_RECOGNITION_MODEL', 'hog')
+    start = time.perf_counter()
+    if model != 'cascade':
+        # Either 'hog' (faster) or 'cnn' (more accurate)
+        face_locations = face_recognition.face_locations(image, model=model)
+        return face_locations, {"path": model, "seconds": time.perf_counter() - start}
+
+    face_locations = face_recognition.face_locations(image, model='hog')
+    path = 'hog'
+    if not face_locations:
+        face_locations = face_recognition.face_locations(image, model='cnn')
+        path = 'cnn_no_face'
+    detection = {"path": path, "seconds": time.perf_counter() - start}
+    record_cascade_path(path, detection["seconds"])
+    return face_locations, detection
+
+
+def get_face_encoding(image_path, model=None, with_detection=False):
+    """Loads an image and returns the first face encoding found.
+
+    When FACE_QUALITY_GATE is enabled, blurry, badly exposed, tiny or
+    off-angle faces are rejected with FaceQualityError before encoding.
+
+    Args:
+        image_path (str): Path of the image on disk.
+        model (str, optional): Detector to use ('hog', 'cnn' or 'cascade').
+            Defaults to FACE_RECOGNITION_MODEL.
+        with_detection (bool): Return (encoding, detection) instead, where
+            detection is the dict from locate_faces (None if detection did not run).
+    """
+    encoding, detection = _encode_first_face(image_path, model)
+    return (encoding, detection) if with_detection else encoding
+
+
+def _encode_first_face(image_path, model):
+    detection = None
     try:
         current_app.logger.debug(f"Loading image for encoding: {image_path}")
         image = face_recognition.load_image_file(image_path)
+        quality_gate = current_app.config.get('FACE_QUALITY_GATE', False)
+        gray = to_grayscale(image) if quality_gate else None
+
+        face_locations, detection = locate_faces(image, model)
+
+        if not face_locations:
+            current_app.logger.warning(f"No face found in image: {image_path}")
+            return None, detection
 
-        # Use model from config - either 'hog' (faster) or 'cnn' (more accurate)
-        model = current_app.config.get('FACE_RECOGNITION_MODEL', 'hog')
-        encodings = face_recognition.face_encodings(image, model=model)
+        face_location = face_locations[0]
+        if quality_gate:
+            check_face_quality(image, gray, face_location)
 
+        # 68-point alignment, as used for every guardian enrolled so far
+        encodings = face_recognition.face_encodings(
+            image, known_face_locations=[face_location], model='large')
         if encodings:
             current_app.logger.info(f"Found face encoding in: {image_path}")
-            return encodings[0]  # Return the first encoding found
+            return encodings[0], detection  # Return the first encoding found
         else:
             current_app.logger.warning(f"No face found in image: {image_path}")
-            return None
+            return None, detection
+    except FaceQualityError as e:
+        current_app.logger.warning(
+            f"Face quality gate rejected {image_path}: {e.reason} {e.detail}")
+        raise
+    except FileNotFoundError:
+        current_app.logger.error(f"Image file not found at path: {image_path}")
+        return None, detection
+    except Exception as e:
+        current_app.logger.error(f"Error processing image {image_path}: {e}")
+        return None, detection
+
+
+def get_face_encodings(image_path):
+    """Loads an image and encodes every face found in it.
+
+    Faces failing the per-face quality checks are reported with their reason
+    instead of being encoded.
+
+    Returns:
+        list: One dict per detected face with "location" (top, right, bottom, left),
+              "encoding" (numpy array or None) and "reason" (None or a reason code),
+              or None if the image could not be processed.
+    """
+    try:
+        current_app.logger.debug(f"Loading image for multi-face encoding: {image_path}")
+        image = face_recognition.load_image_file(image_path)
+        quality_gate = current_app.config.get('FACE_QUALITY_GATE', False)
+        gray = to_grayscale(image) if quality_gate else None
+
+        face_locations, _ = locate_faces(image)
+
+        faces = []
+        good_locations = []
+        for location in face_locations:
+            reason = None
+            if quality_gate:
+                try:
+                    check_face_quality(image, gray, location)
+                except FaceQualityError as e:
+                    reason = e.reason
+            faces.append({"location": location, "encoding": None, "reason": reason})
+            if reason is None:
+                good_locations.append(location)
+
+        # Encode all accepted faces in a single call
+        if good_locations:
+            encodings = face_recognition.face_encodings(
+                image, known_face_locations=good_locations, model='large')
+            by_location = dict(zip(good_locations, encodings))
+            for face in faces:
+                face["encoding"] = by_location.get(face["location"])
+
+        current_app.logger.info(
+            f"Found {len(face_locations)} face(s), {len(good_locations)} encoded, in: {image_path}")
+        return faces
     except FileNotFoundError:
         current_app.logger.error(f"Image file not found at path: {image_path}")
         return None
@@ -92,6 +328,98 @@ def get_face_encoding(image_path):
         return None
 
 
+def match_faces(known_encodings, unknown_encodings, tolerance=None):
+    """Matches several unknown encodings against the gallery in one batched computation.
+
+    Args:
+        known_encodings (list): Gallery face encodings (numpy arrays).
+        unknown_encodings (list): Encodings of the faces to identify.
+        tolerance (float, optional): Max distance for a match. Defaults to config value or 0.6.
+
+    Returns:
+        list: For each unknown encoding, (index of the closest known encoding, distance),
+              with index None when nothing is within tolerance. Malformed known
+              encodings are skipped; if matching fails, every face is (None, None).
+    """
+    if tolerance is None:
+        tolerance = current_app.config.get('FACE_RECOGNITION_TOLERANCE', 0.6)
+    no_match = [(None, None) for _ in unknown_encodings]
+    if not known_encodings or not unknown_encodings:
+        return no_match
+
+    try:
+        unknown = np.asarray(unknown_encodings, dtype=np.float64)  # (F, 128)
+        # Keep the gallery index of every usable known encoding
+        valid = [i for i, enc in enumerate(known_encodings)
+                 if isinstance(enc, np.ndarray) and enc.shape == unknown.shape[1:]]
+        if len(valid) < len(known_encodings):
+            current_app.logger.warning(
+                f"Match faces: skipping {len(known_encodings) - len(valid)} malformed known encoding(s).")
+        if not valid:
+            return no_match
+
+        known = np.asarray([known_encodings[i] for i in valid], dtype=np.float64)  # (G, 128)
+        # ||u - k||^2 = ||u||^2 + ||k||^2 - 2 u.k, as one matrix-matrix product
+        squared = (np.einsum('ij,ij->i', unknown, unknown)[:, None]
+                   + np.einsum('ij,ij->i', known, known)[None, :]
+                   - 2.0 * unknown @ known.T)
+        distances = np.sqrt(np.maximum(squared, 0.0))               # (F, G)
+        best = distances.argmin(axis=1)
+        best_distances = distances[np.arange(len(unknown)), best]
+    except Exception as e:
+        current_app.logger.error(f"Error during face matching: {e}")
+        return no_match
+
+    current_app.logger.info(
+        f"Matched {len(unknown)} face(s) against {len(known)} known faces (tolerance: {tolerance}).")
+    return [(valid[i], float(d)) if d <= tolerance else (None, float(d))
+            for i, d in zip(best, best_distances)]
+
+
+def needs_cnn_refinement(known_encodings, encoding, detection):
+    """True when a cascade match is borderline and worth re-detecting with CNN.
+
+    In 'cascade' mode, an encoding that came from the HOG detector (per the
+    `detection` dict returned alongside it) is borderline when its closest
+    gallery distance lies within FACE_RECOGNITION_CASCADE_BAND of the
+    tolerance. This is only a distance computation against the loaded gallery,
+    so callers can run it without an encoding slot.
+    """
+    if current_app.config.get('FACE_RECOGNITION_MODEL', 'hog') != 'cascade':
+        return False
+    if detection is None or detection["path"] != 'hog':
+        return False  # Already a CNN encoding (HOG found no face)
+    valid_known = [enc for enc in known_encodings if enc is not None]
+    if encoding is None or not valid_known:
+        return False
+
+    tolerance = current_app.config.get('FACE_RECOGNITION_TOLERANCE', 0.6)
+    band = current_app.config.get('FACE_RECOGNITION_CASCADE_BAND', 0.08)
+    best = float(face_recognition.face_distance(valid_known, encoding).min())
+    if abs(best - tolerance) > band:
+        return False
+    current_app.logger.info(
+        f"Ambiguous match distance {best:.3f}; escalating to CNN")
+    return True
+
+
+def refine_ambiguous_encoding(image_path, encoding, detection):
+    """Re-encodes a borderline cascade match with the CNN detector.
+
+    Returns the CNN encoding, or `encoding` unchanged when CNN finds no usable
+    face. The request is counted under 'cnn_ambiguous' instead of 'hog'.
+    """
+    start = time.perf_counter()
+    try:
+        refined = get_face_encoding(image_path, model='cnn')
+    except FaceQualityError:
+        refined = None  # Keep the HOG encoding that already passed the gate
+    finally:
+        record_cascade_path('cnn_ambiguous', time.perf_counter() - start,
+                            replaces=detection)
+    return refined if refined is not None else encoding
+
+
 def compare_faces(known_encodings, unknown_encoding, tolerance=None):
     """Compares an unknown encoding against a list of known encodings.
 
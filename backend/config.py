@@ -30,5 +30,96 @@ class Config:
     # Face recognition settings
     FACE_RECOGNITION_TOLERANCE = float(os.environ.get(
         'FACE_RECOGNITION_TOLERANCE', 0.6))  # Lower is stricter
-    # 'hog' (faster) or 'cnn' (more accurate)
+    # 'hog' (faster), 'cnn' (more accurate) or 'cascade' (HOG first, CNN fallback)
     FACE_RECOGNITION_MODEL = os.environ.get('FACE_RECOGNITION_MODEL', 'hog')
+    # With FACE_RECOGNITION_MODEL='cascade', HOG runs first and CNN only when HOG
+    # finds no face or the best match distance is within this band of the tolerance
+    FACE_RECOGNITION_CASCADE_BAND = float(os.environ.get(
+        'FACE_RECOGNITION_CASCADE_BAND', 0.08))
+
+    # Serving: each in-flight request occupies one WSGI worker thread, so serve
+    # the app with a threaded WSGI server sized for the kiosk count, e.g.
+    #   waitress-serve --threads=32 run:app
+    #   gunicorn -k gthread --threads 32 run:app
+    # Within a request, Firestore reads run on this pool alongside the face
+    # encoding (gallery stream, duplicate check, batched student lookups).
+    FIRESTORE_IO_WORKERS = int(os.environ.get('FIRESTORE_IO_WORKERS', 16))
+
+    # Face quality gate, run before the (expensive) face encoding. Off by default
+    # until the thresholds below are calibrated on real kiosk captures.
+    FACE_QUALITY_GATE = os.environ.get('FACE_QUALITY_GATE', '0').lower() in (
+        '1', 'true', 't', 'yes', 'y')
+    # Minimum variance of the Laplacian over the face crop (lower = blurrier)
+    FACE_QUALITY_MIN_SHARPNESS = float(os.environ.get(
+        'FACE_QUALITY_MIN_SHARPNESS', 40.0))
+    # Accepted mean grayscale brightness of the face crop (0-255)
+    FACE_QUALITY_MIN_BRIGHTNESS = float(os.environ.get(
+        'FACE_QUALITY_MIN_BRIGHTNESS', 40.0))
+    FACE_QUALITY_MAX_BRIGHTNESS = float(os.environ.get(
+        'FACE_QUALITY_MAX_BRIGHTNESS', 220.0))
+    # Minimum face box side in pixels
+    FACE_QUALITY_MIN_FACE_SIZE = int(os.environ.get(
+        'FACE_QUALITY_MIN_FACE_SIZE', 80))
+    # Max nose offset from the eye midpoint, as a fraction of the eye distance (yaw)
+    FACE_QUALITY_MAX_YAW = float(os.environ.get('FACE_QUALITY_MAX_YAW', 0.35))
+    # Max tilt of the eye line in degrees (roll)
+    FACE_QUALITY_MAX_ROLL = float(os.environ.get('FACE_QUALITY_MAX_ROLL', 20.0))
+
+    # Pickup idempotency: retries carrying the same Idempotency-Key header replay
+    # the stored response, and a repeat match of the same guardian/student pair
+    # within the debounce window is not logged again (0 disables debouncing)
+    PICKUP_DEBOUNCE_SECONDS = float(os.environ.get(
+        'PICKUP_DEBOUNCE_SECONDS', 120))
+    IDEMPOTENCY_TTL_SECONDS = float(os.environ.get(
+        'IDEMPOTENCY_TTL_SECONDS', 600))
+    IDEMPOTENCY_CACHE_SIZE = int(os.environ.get('IDEMPOTENCY_CACHE_SIZE', 1024))
+    # A duplicate arriving while the first request is still running waits up to
+    # this long for its result, then gets a 409
+    IDEMPOTENCY_WAIT_SECONDS = float(os.environ.get(
+        'IDEMPOTENCY_WAIT_SECONDS', 60))
+
+    # Encoding scheduler: admission control in front of face encoding.
+    # Verification is served before registration, which is served before
+    # maintenance jobs. Reserved slots come on top of ENCODING_WORKERS and are
+    # only usable by verification, so up to WORKERS + RESERVED encodings can
+    # run at once (e.g. 2 on a single-CPU host with the defaults).
+    ENCODING_WORKERS = int(os.environ.get(
+        'ENCODING_WORKERS', os.cpu_count() or 2))
+    ENCODING_RESERVED_VERIFY_SLOTS = int(os.environ.get(
+        'ENCODING_RESERVED_VERIFY_SLOTS', 1))
+    # Max concurrent encodings per kiosk (X-Kiosk-Id header or client address), 0 = unlimited
+    ENCODING_PER_KIOSK_LIMIT = int(os.environ.get('ENCODING_PER_KIOSK_LIMIT', 2))
+    # Seconds a request may wait for a slot before getting a 503
+    ENCODING_QUEUE_TIMEOUT = float(os.environ.get('ENCODING_QUEUE_TIMEOUT', 30))
+
+    # Operator token, sent as X-Admin-Token, for the admin-only endpoints
+    # (gallery snapshot creation, /admin/profiles, forced profiling). Unset = no access.
+    ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
+
+    # Gallery snapshots for kiosk-side matching (see app/gallery.py)
+    SNAPSHOT_FOLDER = os.path.join(UPLOAD_FOLDER, 'snapshots')
+    SNAPSHOT_RETENTION = int(os.environ.get('SNAPSHOT_RETENTION', 20))
+    # Kiosks read snapshots and deltas with this X-Kiosk-Token; creating a
+    # snapshot needs the X-Admin-Token (ADMIN_TOKEN). Unset = no access.
+    GALLERY_KIOSK_TOKEN = os.environ.get('GALLERY_KIOSK_TOKEN')
+
+    # Background registration jobs (POST /register_guardian with "Prefer: respond-async")
+    REGISTRATION_JOB_WORKERS = int(os.environ.get('REGISTRATION_JOB_WORKERS', 2))
+    REGISTRATION_JOB_MAX_PENDING = int(os.environ.get(
+        'REGISTRATION_JOB_MAX_PENDING', 100))
+    # How long job statuses (Firestore `jobs` collection) can be polled; add a
+    # Firestore TTL policy on jobs.expires_at to delete them afterwards
+    JOB_RETENTION_SECONDS = float(os.environ.get('JOB_RETENTION_SECONDS', 3600))
+
+    # Sampling profiler (see app/profiling.py). When enabled, a sampled fraction
+    # of requests plus every request slower than the threshold is kept as a
+    # collapsed-stack profile. Requests with "X-Profile: 1" and a valid
+    # X-Admin-Token are always profiled; the token also guards /admin/profiles.
+    PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', '0').lower() in (
+        '1', 'true', 't', 'yes', 'y')
+    PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', 0.01))
+    PROFILING_SLOW_THRESHOLD_MS = int(os.environ.get(
+        'PROFILING_SLOW_THRESHOLD_MS', 2000))
+    PROFILING_INTERVAL_MS = float(os.environ.get('PROFILING_INTERVAL_MS', 5))
+    PROFILING_FOLDER = os.path.join(UPLOAD_FOLDER, 'profiles')
+    PROFILING_MAX_FILES = int(os.environ.get('PROFILING_MAX_FILES', 50))
@@ -0,0 +1 @@
+"""Load-testing harness (run with `python -m loadtest`)."""
@@ -0,0 +1,291 @@
+"""Multi-kiosk load generator for the FR Safe Kids backend.
+
+Boots create_app against an in-process Firestore stand-in seeded with
+synthetic guardians and students, serves it on a local port and drives
+/verify_pickup and /register_guardian from concurrent virtual kiosks that
+replay an image corpus. Results are printed and appended to a JSON Lines
+file so capacity can be tracked across releases.
+
+Usage (from the backend folder):
+    python -m loadtest --corpus path/to/images --kiosks 20 --duration 60
+
+--server waitress runs the app under waitress, the documented production
+WSGI server (see config.py), with --threads worker threads; it must be
+installed separately. The default werkzeug server starts one thread per
+connection. The server used is recorded with the results. Views are
+synchronous; the app has no async mode, so there is none to cover.
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import subprocess
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+import requests
+from werkzeug.serving import make_server
+
+from config import Config
+from loadtest.fake_firestore import FakeFirestore
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+
+def load_corpus(corpus_dir):
+    """Returns (filename, bytes) for every image in the corpus folder."""
+    images = []
+    for entry in sorted(os.listdir(corpus_dir)):
+        if entry.lower().endswith(IMAGE_EXTENSIONS):
+            with open(os.path.join(corpus_dir, entry), 'rb') as f:
+                images.append((entry, f.read()))
+    if not images:
+        raise SystemExit(f"No images found in corpus folder: {corpus_dir}")
+    return images
+
+
+def seed_firestore(db, corpus_dir, num_guardians, num_students, seed):
+    """Seeds students and guardians.
+
+    The first guardians get the real encodings of the corpus images so that
+    verification requests can match; the rest get synthetic encodings that
+    sit far from any real face at the default tolerance.
+    """
+    import face_recognition
+
+    rng = np.random.default_rng(seed)
+    student_ids = [f"student{i:05d}" for i in range(num_students)]
+    for i, s_id in enumerate(student_ids):
+        db.apply_set('students', s_id, {
+            "name": f"Student {i}",
+            "teacher_email": f"teacher{i % 25}@example.com",
+            "guardian_ids": []
+        })
+
+    real_encodings = []
+    for entry in sorted(os.listdir(corpus_dir)):
+        if entry.lower().endswith(IMAGE_EXTENSIONS):
+            image = face_recognition.load_image_file(
+                os.path.join(corpus_dir, entry))
+            encodings = face_recognition.face_encodings(image, model='large')
+            if encodings:
+                real_encodings.append(encodings[0])
+
+    for i in range(num_guardians):
+        if i < len(real_encodings):
+            encoding = real_encodings[i]
+        else:
+            encoding = rng.normal(0.0, 0.09, 128)
+        g_id = f"guardian{i:05d}"
+        owned = [str(s_id) for s_id in rng.choice(
+            student_ids, size=min(2, num_students), replace=False)]
+        db.apply_set('guardians', g_id, {
+            "name": f"Guardian {i}",
+            "reference_image_path": f"reference/seed_{i}.jpg",
+            "_face_encoding": json.dumps(np.asarray(encoding).tolist()),
+            "student_ids": owned
+        })
+        for s_id in owned:
+            db.data['students'][s_id]['guardian_ids'].append(g_id)
+    return student_ids, len(real_encodings)
+
+
+def kiosk_worker(kiosk_id, base_url, corpus, student_ids, args, deadline, samples, lock):
+    """Virtual kiosk: replays corpus images until the deadline."""
+    rng = random.Random(args.seed + kiosk_id)
+    session = requests.Session()
+    # All virtual kiosks share one address, so identify them explicitly
+    session.headers['X-Kiosk-Id'] = f"loadtest-kiosk-{kiosk_id}"
+    sequence = 0
+    while time.monotonic() < deadline:
+        filename, payload = rng.choice(corpus)
+        name, ext = os.path.splitext(filename)
+        # Unique upload names keep registrations from colliding on file paths
+        upload_name = f"k{kiosk_id}_{sequence}_{name}{ext}"
+        sequence += 1
+
+        if rng.random() < args.register_ratio:
+            endpoint = '/register_guardian'
+            data = {"name": f"Load Guardian {kiosk_id}-{sequence}",
+                    "student_ids": ','.join(rng.sample(student_ids, 1))}
+        else:
+            endpoint = '/verify_pickup'
+            data = {}
+
+        start = time.perf_counter()
+        try:
+            response = session.post(base_url + endpoint, data=data,
+                                    files={"image": (upload_name, payload)},
+                                    timeout=args.timeout)
+            status = response.status_code
+        except requests.RequestException:
+            status = None
+        latency = time.perf_counter() - start
+        with lock:
+            samples.append((endpoint, status, latency))
+
+
+def summarize(samples, elapsed):
+    """Aggregates samples into per-endpoint throughput, latency and error stats."""
+    report = {}
+    for endpoint in sorted({s[0] for s in samples}):
+        rows = [s for s in samples if s[0] == endpoint]
+        latencies_ms = np.array([s[2] for s in rows]) * 1000.0
+        statuses = {}
+        for _, status, _ in rows:
+            key = str(status) if status is not None else 'connection_error'
+            statuses[key] = statuses.get(key, 0) + 1
+        errors = sum(1 for _, status, _ in rows
+                     if status is None or status >= 500)
+        report[endpoint] = {
+            "requests": len(rows),
+            "throughput_rps": round(len(rows) / elapsed, 2),
+            "p50_ms": round(float(np.percentile(latencies_ms, 50)), 1),
+            "p95_ms": round(float(np.percentile(latencies_ms, 95)), 1),
+            "p99_ms": round(float(np.percentile(latencies_ms, 99)), 1),
+            "max_ms": round(float(latencies_ms.max()), 1),
+            "error_rate": round(errors / len(rows), 4),
+            "status_counts": statuses
+        }
+    return report
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def start_server(app, kind, threads):
+    """Serves the app on a local port in a background thread.
+
+    Returns:
+        tuple: (base_url, stop) where stop() shuts the server down.
+    """
+    if kind == 'waitress':
+        try:
+            from waitress.server import create_server
+        except ImportError:
+            raise SystemExit("--server waitress needs the waitress package (pip install waitress)")
+        server = create_server(app, host='127.0.0.1', port=0, threads=threads)
+        threading.Thread(target=server.run, daemon=True).start()
+        return f"http://127.0.0.1:{server.effective_port}", server.close
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}", server.shutdown
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Drive the backend from concurrent virtual kiosks.")
+    parser.add_argument('--corpus', required=True,
+                        help="Folder of face images to replay")
+    parser.add_argument('--guardians', type=int, default=200,
+                        help="Synthetic guardians to seed")
+    parser.add_argument('--students', type=int, default=300,
+                        help="Synthetic students to seed")
+    parser.add_argument('--kiosks', type=int, default=10,
+                        help="Concurrent virtual kiosks")
+    parser.add_argument('--duration', type=float, default=30.0,
+                        help="Test duration in seconds")
+    parser.add_argument('--register-ratio', type=float, default=0.1,
+                        help="Fraction of requests sent to /register_guardian")
+    parser.add_argument('--latency-ms', type=float, default=20.0,
+                        help="Simulated Firestore round-trip time")
+    parser.add_argument('--debounce-seconds', type=float, default=0.0,
+                        help="PICKUP_DEBOUNCE_SECONDS for the run; the corpus is replayed, "
+                             "so anything above 0 turns most verifications into cache hits")
+    parser.add_argument('--server', choices=('werkzeug', 'waitress'), default='werkzeug',
+                        help="WSGI server to run the app under")
+    parser.add_argument('--threads', type=int, default=32,
+                        help="Worker threads for --server waitress")
+    parser.add_argument('--timeout', type=float, default=60.0,
+                        help="Per-request client timeout in seconds")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--label', default=None,
+                        help="Release or build label stored with the results")
+    parser.add_argument('--output', default='loadtest_results.jsonl',
+                        help="JSON Lines file the results are appended to")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    corpus = load_corpus(args.corpus)
+
+    upload_root = tempfile.mkdtemp(prefix='frsk_loadtest_')
+
+    class LoadTestConfig(Config):
+        UPLOAD_FOLDER = upload_root
+        REFERENCE_FOLDER = os.path.join(upload_root, 'reference')
+        VERIFIED_FOLDER = os.path.join(upload_root, 'verified')
+        PICKUP_DEBOUNCE_SECONDS = args.debounce_seconds
+
+    db = FakeFirestore(latency_ms=args.latency_ms)
+    student_ids, matchable = seed_firestore(
+        db, args.corpus, args.guardians, args.students, args.seed)
+    print(f"Seeded {args.guardians} guardians ({matchable} from corpus) "
+          f"and {args.students} students")
+
+    from app import create_app
+    app = create_app(LoadTestConfig, firestore_client=db)
+    logging.getLogger().setLevel(logging.WARNING)
+    app.logger.setLevel(logging.WARNING)
+
+    base_url, stop_server = start_server(app, args.server, args.threads)
+
+    samples = []
+    lock = threading.Lock()
+    start = time.monotonic()
+    deadline = start + args.duration
+    kiosks = [threading.Thread(target=kiosk_worker,
+                               args=(k, base_url, corpus, student_ids, args,
+                                     deadline, samples, lock))
+              for k in range(args.kiosks)]
+    for t in kiosks:
+        t.start()
+    for t in kiosks:
+        t.join()
+    elapsed = time.monotonic() - start
+    stop_server()
+
+    result = {
+        "timestamp": datetime.utcnow().isoformat() + "Z",
+        "label": args.label,
+        "git_revision": git_revision(),
+        "params": {
+            "kiosks": args.kiosks,
+            "duration_s": args.duration,
+            "guardians": args.guardians,
+            "students": args.students,
+            "register_ratio": args.register_ratio,
+            "firestore_latency_ms": args.latency_ms,
+            "debounce_seconds": args.debounce_seconds,
+            "face_model": app.config.get('FACE_RECOGNITION_MODEL'),
+            "corpus_images": len(corpus),
+            "server": args.server,
+            # werkzeug starts a thread per connection instead of a fixed pool
+            "server_threads": args.threads if args.server == 'waitress' else None,
+            "views": "sync (no async mode exists)"
+        },
+        "elapsed_s": round(elapsed, 2),
+        "total_throughput_rps": round(len(samples) / elapsed, 2),
+        "firestore_round_trips": db.round_trips,
+        "endpoints": summarize(samples, elapsed)
+    }
+
+    print(json.dumps(result, indent=2))
+    with open(args.output, 'a') as f:
+        f.write(json.dumps(result) + "\n")
+    print(f"Results appended to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+import threading
+import time
+import uuid
+import copy
+
+
+class FakeDocumentSnapshot:
+    def __init__(self, doc_id, data):
+        self.id = doc_id
+        self._data = data
+        self.exists = data is not None
+
+    def to_dict(self):
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+
+class FakeDocumentReference:
+    def __init__(self, store, collection, doc_id):
+        self._store = store
+        self._collection = collection
+        self.id = doc_id
+
+    def get(self):
+        self._store.round_trip()
+        with self._store.lock:
+            data = self._store.data[self._collection].get(self.id)
+            return FakeDocumentSnapshot(self.id, copy.deepcopy(data))
+
+    def set(self, data):
+        self._store.round_trip()
+        self._store.apply_set(self._collection, self.id, data)
+
+    def update(self, data):
+        self._store.round_trip()
+        self._store.apply_update(self._collection, self.id, data)
+
+
+class FakeQuery:
+    def __init__(self, store, collection, filters=None, limit=None):
+        self._store = store
+        self._collection = collection
+        self._filters = filters or []
+        self._limit = limit
+
+    def where(self, field, op, value):
+        if op not in ('==', 'array_contains'):
+            raise NotImplementedError(f"Unsupported operator: {op}")
+        return FakeQuery(self._store, self._collection,
+                         self._filters + [(field, op, value)], self._limit)
+
+    def limit(self, count):
+        return FakeQuery(self._store, self._collection, self._filters, count)
+
+    def _matches(self, data):
+        for field, op, value in self._filters:
+            if op == '==' and data.get(field) != value:
+                return False
+            if op == 'array_contains' and value not in (data.get(field) or []):
+                return False
+        return True
+
+    def stream(self):
+        self._store.round_trip()
+        with self._store.lock:
+            items = list(self._store.data[self._collection].items())
+        results = [FakeDocumentSnapshot(doc_id, copy.deepcopy(data))
+                   for doc_id, data in items if self._matches(data)]
+        if self._limit is not None:
+            results = results[:self._limit]
+        return iter(results)
+
+    def get(self):
+        return list(self.stream())
+
+
+class FakeCollectionReference(FakeQuery):
+    def __init__(self, store, collection):
+        super().__init__(store, collection)
+
+    def document(self, doc_id=None):
+        return FakeDocumentReference(self._store, self._collection,
+                                     doc_id or uuid.uuid4().hex[:20])
+
+
+class FakeWriteBatch:
+    def __init__(self, store):
+        self._store = store
+        self._ops = []
+
+    def set(self, ref, data):
+        self._ops.append(('set', ref, data))
+
+    def update(self, ref, data):
+        self._ops.append(('update', ref, data))
+
+    def commit(self):
+        self._store.round_trip()
+        with self._store.lock:
+            for op, ref, data in self._ops:
+                if op == 'set':
+                    self._store.apply_set(ref._collection, ref.id, data)
+                else:
+                    self._store.apply_update(ref._collection, ref.id, data)
+        self._store.batch_commits += 1
+        self._ops = []
+
+
+class FakeFirestore:
+    """In-process stand-in for the subset of the Firestore client the routes use.
+
+    Args:
+        latency_ms (float): Simulated round-trip time added to every read,
+            write and batch commit, to approximate a remote Firestore.
+    """
+
+    def __init__(self, latency_ms=0.0):
+        self.latency = latency_ms / 1000.0
+        self.lock = threading.RLock()
+        self.data = {}
+        self.round_trips = 0
+        self.batch_commits = 0
+
+    def round_trip(self):
+        with self.lock:
+            self.round_trips += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def collection(self, name):
+        with self.lock:
+            self.data.setdefault(name, {})
+        return FakeCollectionReference(self, name)
+
+    def batch(self):
+        return FakeWriteBatch(self)
+
+    def get_all(self, references):
+        """Fetches several documents in a single round trip, like Client.get_all."""
+        references = list(references)
+        self.round_trip()
+        with self.lock:
+            return iter([FakeDocumentSnapshot(
+                ref.id, copy.deepcopy(self.data.get(ref._collection, {}).get(ref.id)))
+                for ref in references])
+
+    def apply_set(self, collection, doc_id, data):
+        with self.lock:
+            self.data.setdefault(collection, {})[doc_id] = copy.deepcopy(data)
+
+    def apply_update(self, collection, doc_id, data):
+        with self.lock:
+            docs = self.data.setdefault(collection, {})
+            if doc_id not in docs:
+                raise KeyError(f"No document to update: {collection}/{doc_id}")
+            doc = docs[doc_id]
+            for field, value in data.items():
+                # ArrayUnion / ArrayRemove transforms expose their operands as .values
+                if type(value).__name__ == 'ArrayUnion':
+                    current = list(doc.get(field) or [])
+                    current.extend(v for v in value.values if v not in current)
+                    doc[field] = current
+                elif type(value).__name__ == 'ArrayRemove':
+                    doc[field] = [v for v in (doc.get(field) or [])
+                                  if v not in value.values]
+                else:
+                    doc[field] = copy.deepcopy(value)
@@ -1,6 +1,7 @@
 from app import create_app, firestore_db
 from app.models import Guardian, Student, PickupLog
 import os
+import click
 
 app = create_app()
 
@@ -12,6 +13,24 @@ def make_shell_context():
     return {'firestore_db': firestore_db, 'Guardian': Guardian, 'Student': Student, 'PickupLog': PickupLog}
 
 
+@app.cli.command('export-gallery')
+@click.option('--since', type=int, default=None,
+              help='Also write a delta file from this snapshot version.')
+def export_gallery(since):
+    """Export the guardian gallery as a versioned snapshot (and optional delta)."""
+    from app import firestore_db  # Set by create_app above
+    from app.gallery import export_snapshot, export_delta
+    manifest, created = export_snapshot(firestore_db)
+    click.echo(f"Snapshot v{manifest['version']}{'' if created else ' (unchanged)'}: "
+               f"{manifest['count']} guardians ({manifest['encodings_file']})")
+    if since is not None:
+        delta_path, to_version = export_delta(since, manifest['version'])
+        if delta_path is None:
+            click.echo(f"Snapshot v{since} not available; no delta written.")
+        else:
+            click.echo(f"Delta v{since}->v{to_version}: {delta_path}")
+
+
 if __name__ == "__main__":
     # Get debug mode from environment or default to False for safety
     debug_mode = os.environ.get('FLASK_DEBUG', '0').lower() in (
@@ -0,0 +1,104 @@
+import numpy as np
+import pytest
+from flask import Flask
+
+pytest.importorskip('face_recognition')
+from app import utils  # noqa: E402
+from app.utils import locate_faces, record_cascade_path, get_cascade_stats, \
+    needs_cnn_refinement, refine_ambiguous_encoding  # noqa: E402
+
+BOX = (10, 90, 90, 10)
+
+
+@pytest.fixture
+def app(monkeypatch):
+    app = Flask(__name__)
+    app.config.update(FACE_RECOGNITION_MODEL='cascade', FACE_RECOGNITION_TOLERANCE=0.6,
+                      FACE_RECOGNITION_CASCADE_BAND=0.08)
+    with app.app_context():
+        yield app
+
+
+@pytest.fixture
+def detector(monkeypatch):
+    """Fake detectors: `found` maps model name -> boxes it returns; calls are logged."""
+    class Detector:
+        found = {'hog': [BOX], 'cnn': [BOX]}
+        calls = []
+
+        def __call__(self, image, model='hog'):
+            self.calls.append(model)
+            return list(self.found[model])
+    detector = Detector()
+    monkeypatch.setattr(utils.face_recognition, 'face_locations', detector)
+    return detector
+
+
+def _counts():
+    return {path: entry["count"] for path, entry in get_cascade_stats().items()}
+
+
+def test_hog_hit_is_counted_as_hog(app, detector):
+    locations, detection = locate_faces(np.zeros((100, 100, 3)))
+
+    assert locations == [BOX]
+    assert detection["path"] == 'hog'
+    assert detector.calls == ['hog']
+    assert _counts() == {'hog': 1}
+
+
+def test_no_hog_face_falls_back_to_cnn(app, detector):
+    detector.found = {'hog': [], 'cnn': [BOX]}
+
+    locations, detection = locate_faces(np.zeros((100, 100, 3)))
+
+    assert locations == [BOX]
+    assert detection["path"] == 'cnn_no_face'
+    assert detector.calls == ['hog', 'cnn']
+    assert _counts() == {'cnn_no_face': 1}
+
+
+def test_single_model_runs_are_not_counted(app, detector):
+    _, detection = locate_faces(np.zeros((100, 100, 3)), model='cnn')
+
+    assert detection["path"] == 'cnn'
+    assert _counts() == {}
+
+
+def test_escalation_moves_the_request_from_hog_to_cnn_ambiguous(app):
+    record_cascade_path('hog', 0.010)
+    detection = {"path": 'hog', "seconds": 0.020}
+    record_cascade_path('hog', detection["seconds"])
+
+    record_cascade_path('cnn_ambiguous', 0.200, replaces=detection)
+
+    stats = get_cascade_stats()
+    assert _counts() == {'hog': 1, 'cnn_ambiguous': 1}
+    assert stats['hog']['avg_ms'] == pytest.approx(10.0)
+    assert stats['cnn_ambiguous']['avg_ms'] == pytest.approx(220.0)  # HOG pass included
+    assert stats['hog']['share'] == stats['cnn_ambiguous']['share'] == 0.5
+
+
+def test_only_borderline_hog_matches_need_cnn(app):
+    known = [np.zeros(128)]
+    borderline = np.zeros(128)
+    borderline[0] = 0.62
+    clear = np.zeros(128)
+    clear[0] = 0.2
+    hog = {"path": 'hog', "seconds": 0.0}
+
+    assert needs_cnn_refinement(known, borderline, hog)
+    assert not needs_cnn_refinement(known, clear, hog)
+    assert not needs_cnn_refinement(known, borderline, {"path": 'cnn_no_face', "seconds": 0.0})
+    app.config['FACE_RECOGNITION_MODEL'] = 'hog'
+    assert not needs_cnn_refinement(known, borderline, hog)
+
+
+def test_refinement_keeps_hog_encoding_when_cnn_finds_nothing(app, monkeypatch):
+    hog_encoding = np.ones(128)
+    detection = {"path": 'hog', "seconds": 0.0}
+    record_cascade_path('hog', 0.0)
+    monkeypatch.setattr(utils, 'get_face_encoding', lambda path, model=None: None)
+
+    assert refine_ambiguous_encoding('probe.png', hog_encoding, detection) is hog_encoding
+    assert _counts() == {'cnn_ambiguous': 1}
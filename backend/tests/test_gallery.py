@@ -0,0 +1,118 @@
+import json
+
+import numpy as np
+import pytest
+from flask import Flask
+
+from app.gallery import export_snapshot, export_delta, diff_manifests, list_versions, snapshot_paths
+from loadtest.fake_firestore import FakeFirestore
+
+
+@pytest.fixture
+def app_context(tmp_path):
+    app = Flask(__name__)
+    app.config['SNAPSHOT_FOLDER'] = str(tmp_path / 'snapshots')
+    app.config['SNAPSHOT_RETENTION'] = 20
+    with app.app_context():
+        yield
+
+
+def _set_guardian(db, guardian_id, name, seed, student_ids=('s1',)):
+    encoding = np.random.default_rng(seed).normal(0, 0.1, 128)
+    db.apply_set('guardians', guardian_id, {
+        "name": name,
+        "reference_image_path": f"reference/{guardian_id}.png",
+        "_face_encoding": json.dumps(encoding.tolist()),
+        "student_ids": list(student_ids)
+    })
+
+
+def _manifest(rows):
+    return {"guardians": [{"id": g_id, "digest": digest} for g_id, digest in rows]}
+
+
+def test_diff_detects_upserts_and_removals():
+    base = _manifest([("a", "1"), ("b", "2"), ("c", "3")])
+    current = _manifest([("a", "1"), ("b", "changed"), ("d", "4")])
+
+    upserts, upsert_idx, removed_ids = diff_manifests(base, current)
+
+    assert [r["id"] for r in upserts] == ["b", "d"]
+    assert upsert_idx == [1, 2]
+    assert removed_ids == ["c"]
+
+
+def test_delta_between_exported_snapshots(app_context):
+    db = FakeFirestore()
+    _set_guardian(db, 'g1', 'Ana', seed=1)
+    _set_guardian(db, 'g2', 'Ben', seed=2)
+    _set_guardian(db, 'g3', 'Cy', seed=3)
+    base, created = export_snapshot(db)
+    assert created and base["version"] == 1
+
+    _set_guardian(db, 'g2', 'Ben', seed=2, student_ids=('s1', 's2'))  # changed students
+    _set_guardian(db, 'g4', 'Dee', seed=4)                             # new guardian
+    db.data['guardians'].pop('g3')                                      # removed guardian
+    current, created = export_snapshot(db)
+    assert created and current["version"] == 2
+
+    delta_path, to_version = export_delta(1)
+    assert to_version == 2
+    delta = np.load(delta_path)
+    assert list(delta['ids']) == ['g2', 'g4']
+    assert list(delta['removed_ids']) == ['g3']
+    assert [json.loads(s) for s in delta['student_ids']] == [['s1', 's2'], ['s1']]
+    expected = np.fromfile(snapshot_paths(2)[0], dtype='<f4').reshape(-1, 128)[[1, 2]]
+    np.testing.assert_array_equal(delta['encodings'], expected)
+
+
+def test_unchanged_gallery_does_not_create_a_version(app_context):
+    db = FakeFirestore()
+    _set_guardian(db, 'g1', 'Ana', seed=1)
+    export_snapshot(db)
+
+    manifest, created = export_snapshot(db)
+
+    assert not created
+    assert manifest["version"] == 1
+    assert list_versions() == [1]
+
+
+def test_same_guardian_under_a_new_id_creates_a_version(app_context):
+    db = FakeFirestore()
+    _set_guardian(db, 'g1', 'Ana', seed=1)
+    export_snapshot(db)
+    db.data['guardians'] = {'g2': db.data['guardians'].pop('g1')}
+
+    manifest, created = export_snapshot(db)
+
+    assert created
+    assert [r["id"] for r in manifest["guardians"]] == ['g2']
+
+
+def test_delta_serves_only_existing_versions(app_context):
+    db = FakeFirestore()
+    _set_guardian(db, 'g1', 'Ana', seed=1)
+    export_snapshot(db)
+    _set_guardian(db, 'g2', 'Ben', seed=2)
+
+    delta_path, to_version = export_delta(1)
+
+    assert to_version == 1  # The new guardian is not exported by a delta request
+    assert len(np.load(delta_path)['ids']) == 0
+    assert list_versions() == [1]
+    assert export_delta(5) == (None, None)
+
+
+def test_export_skips_a_version_claimed_by_another_process(app_context):
+    db = FakeFirestore()
+    _set_guardian(db, 'g1', 'Ana', seed=1)
+    export_snapshot(db)
+    # Another exporter has linked v2's encodings but not yet written its manifest
+    open(snapshot_paths(2)[0], 'wb').close()
+    _set_guardian(db, 'g2', 'Ben', seed=2)
+
+    manifest, created = export_snapshot(db)
+
+    assert created and manifest["version"] == 3
+    assert list_versions() == [1, 3]
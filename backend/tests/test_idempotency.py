@@ -0,0 +1,84 @@
+import threading
+import time
+
+import pytest
+
+from app import idempotency
+from app.idempotency import TTLCache, PendingKeys, RequestInProgress
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(idempotency.time, 'monotonic', clock)
+    return clock
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = TTLCache(maxsize=10, ttl=60)
+    cache.set('key', 'value')
+
+    clock.now += 59
+    assert cache.get('key') == 'value'
+    clock.now += 2
+    assert cache.get('key') is None
+
+
+def test_set_refreshes_the_ttl(clock):
+    cache = TTLCache(maxsize=10, ttl=60)
+    cache.set('key', 'old')
+    clock.now += 50
+    cache.set('key', 'new')
+    clock.now += 50
+    assert cache.get('key') == 'new'
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1  # 'b' is now the least recently used
+
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+
+
+def test_reserve_waits_for_release_and_selects_remaining_work():
+    pending = PendingKeys()
+    assert pending.reserve(['k'], timeout=1) == {'k'}
+
+    done = []
+    result = {}
+
+    def second():
+        # The first holder finished the work, so nothing is left to reserve
+        result['keys'] = pending.reserve(['k'], timeout=5, select=lambda: [] if done else ['k'])
+
+    thread = threading.Thread(target=second)
+    thread.start()
+    time.sleep(0.05)
+    assert thread.is_alive()
+
+    done.append(True)
+    pending.release(['k'])
+    thread.join(timeout=5)
+    assert result['keys'] == set()
+    assert pending.reserve(['k'], timeout=0) == {'k'}
+
+
+def test_reserve_times_out_while_key_is_held():
+    pending = PendingKeys()
+    pending.reserve(['k'], timeout=1)
+    with pytest.raises(RequestInProgress):
+        pending.reserve(['k', 'other'], timeout=0.05)
+    assert pending.reserve(['other'], timeout=0) == {'other'}
@@ -0,0 +1,110 @@
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from flask import Flask, jsonify
+
+from app.jobs import JobManager, JobQueueFull
+from loadtest.fake_firestore import FakeFirestore
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    with app.app_context():
+        yield app
+
+
+@pytest.fixture
+def db():
+    return FakeFirestore()
+
+
+def _manager(app, db, max_pending=10, ttl=60):
+    return JobManager(app, db, workers=1, max_pending=max_pending, ttl=ttl)
+
+
+def _wait(manager, job_id, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = manager.get(job_id)
+        if job["status"] in ('succeeded', 'failed'):
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} did not finish")
+
+
+def _blocking(started, release, status=200):
+    def work():
+        started.set()
+        release.wait(5)
+        return jsonify({"ok": status < 400}), status
+    return work
+
+
+def test_job_goes_from_queued_to_running_to_succeeded(app, db):
+    manager = _manager(app, db)
+    blocker_started, release = threading.Event(), threading.Event()
+    blocker = manager.submit(_blocking(blocker_started, release))
+    started = threading.Event()
+
+    job = manager.submit(_blocking(started, release))
+    assert blocker_started.wait(5)
+    assert manager.get(job["id"])["status"] == 'queued'
+    assert manager.get(blocker["id"])["status"] == 'running'
+    release.set()
+
+    finished = _wait(manager, job["id"])
+    assert finished["status"] == 'succeeded'
+    assert finished["http_status"] == 200
+    assert finished["result"] == {"ok": True}
+
+
+def test_error_status_and_exception_mark_the_job_failed(app, db):
+    manager = _manager(app, db)
+    release = threading.Event()
+    release.set()
+
+    def boom():
+        raise RuntimeError("boom")
+
+    rejected = manager.submit(_blocking(threading.Event(), release, status=404))
+    crashed = manager.submit(boom)
+
+    assert _wait(manager, rejected["id"])["http_status"] == 404
+    assert _wait(manager, rejected["id"])["status"] == 'failed'
+    assert _wait(manager, crashed["id"])["http_status"] == 500
+
+
+def test_full_queue_rejects_until_a_job_finishes(app, db):
+    manager = _manager(app, db, max_pending=1)
+    started, release = threading.Event(), threading.Event()
+    job = manager.submit(_blocking(started, release))
+
+    with pytest.raises(JobQueueFull):
+        manager.submit(_blocking(threading.Event(), release))
+    release.set()
+    _wait(manager, job["id"])
+
+    deadline = time.monotonic() + 5
+    while True:  # the worker releases its queue slot just after storing the outcome
+        try:
+            manager.submit(_blocking(threading.Event(), release))
+            break
+        except JobQueueFull:
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+
+
+def test_jobs_are_visible_to_other_processes_until_they_expire(app, db):
+    release = threading.Event()
+    release.set()
+    job = _manager(app, db).submit(_blocking(threading.Event(), release))
+    other_process = _manager(app, db)
+
+    assert _wait(other_process, job["id"])["status"] == 'succeeded'
+    db.apply_update('jobs', job["id"], {
+        "expires_at": datetime.now(timezone.utc) - timedelta(seconds=1)})
+    assert other_process.get(job["id"]) is None
+    assert other_process.get('unknown') is None
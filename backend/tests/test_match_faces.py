@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+from flask import Flask
+
+pytest.importorskip('face_recognition')
+from app.utils import match_faces  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def app_context():
+    app = Flask(__name__)
+    app.config['FACE_RECOGNITION_TOLERANCE'] = 0.6
+    with app.app_context():
+        yield
+
+
+def _unit(index):
+    encoding = np.zeros(128)
+    encoding[index] = 1.0
+    return encoding
+
+
+def test_each_face_gets_its_closest_known_encoding():
+    known = [_unit(0), _unit(1), _unit(2)]
+    unknown = [_unit(2) + 0.01, _unit(0) - 0.02]
+
+    matches = match_faces(known, unknown)
+
+    assert [index for index, _ in matches] == [2, 0]
+    assert matches[0][1] == pytest.approx(np.linalg.norm(np.full(128, 0.01)))
+
+
+def test_faces_beyond_tolerance_report_distance_without_index():
+    known = [_unit(0)]
+    unknown = [_unit(1)]  # sqrt(2) away
+
+    (index, distance), = match_faces(known, unknown, tolerance=0.6)
+
+    assert index is None
+    assert distance == pytest.approx(np.sqrt(2))
+
+
+def test_matches_agree_with_per_face_distances():
+    rng = np.random.default_rng(0)
+    known = list(rng.normal(0, 0.1, (20, 128)))
+    unknown = [known[7] + rng.normal(0, 0.01, 128), rng.normal(0, 0.1, 128)]
+
+    matches = match_faces(known, unknown, tolerance=10.0)
+
+    for face, (index, distance) in zip(unknown, matches):
+        distances = np.linalg.norm(np.asarray(known) - face, axis=1)
+        assert index == int(distances.argmin())
+        assert distance == pytest.approx(distances.min())
+
+
+def test_empty_gallery_matches_nothing():
+    assert match_faces([], [_unit(0)]) == [(None, None)]
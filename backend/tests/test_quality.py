@@ -0,0 +1,109 @@
+import numpy as np
+import pytest
+from flask import Flask
+
+pytest.importorskip('face_recognition')
+from app import utils  # noqa: E402
+from app.utils import FaceQualityError, _laplacian_variance, check_face_quality, \
+    to_grayscale  # noqa: E402
+
+BOX = (0, 100, 100, 0)  # top, right, bottom, left
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    with app.app_context():
+        yield app
+
+
+def _landmarks(monkeypatch, left_eye, right_eye, nose):
+    """Makes the 5-point landmark model return the given eye centres and nose tip."""
+    def face_landmarks(image, locations, model='large'):
+        return [{'left_eye': [left_eye, left_eye], 'right_eye': [right_eye, right_eye],
+                 'nose_tip': [nose]}]
+    monkeypatch.setattr(utils.face_recognition, 'face_landmarks', face_landmarks)
+
+
+def _textured(shape=(100, 100), mean=128.0):
+    rng = np.random.default_rng(0)
+    return np.clip(rng.normal(mean, 30.0, shape), 0, 255)
+
+
+def _rgb(gray):
+    return np.repeat(gray[:, :, None], 3, axis=2).astype(np.uint8)
+
+
+def _reason(image, box=BOX):
+    try:
+        check_face_quality(image, to_grayscale(image), box)
+    except FaceQualityError as e:
+        return e.reason
+    return None
+
+
+def test_laplacian_variance_is_zero_for_flat_image():
+    assert _laplacian_variance(np.full((20, 20), 100.0)) == 0.0
+
+
+def test_laplacian_variance_grows_with_texture():
+    assert _laplacian_variance(_textured()) > 1000.0
+
+
+def test_laplacian_variance_of_tiny_crop_is_zero():
+    assert _laplacian_variance(np.array([[0.0, 255.0], [255.0, 0.0]])) == 0.0
+
+
+def test_frontal_face_passes(app, monkeypatch):
+    _landmarks(monkeypatch, (30, 40), (70, 40), (50, 60))
+
+    assert _reason(_rgb(_textured())) is None
+
+
+def test_small_face_is_rejected(app, monkeypatch):
+    _landmarks(monkeypatch, (30, 40), (70, 40), (50, 60))
+
+    assert _reason(_rgb(_textured()), (0, 50, 50, 0)) == 'face_too_small'
+
+
+def test_blurry_face_is_rejected(app, monkeypatch):
+    _landmarks(monkeypatch, (30, 40), (70, 40), (50, 60))
+
+    assert _reason(_rgb(np.full((100, 100), 128.0))) == 'too_blurry'
+
+
+def test_backlit_face_in_bright_frame_is_too_dark(app, monkeypatch):
+    _landmarks(monkeypatch, (130, 40), (170, 40), (150, 60))
+    frame = np.full((100, 300), 250.0)
+    frame[:, 100:200] = _textured(mean=20.0)
+    image = _rgb(frame)
+
+    assert to_grayscale(image).mean() > 150  # the frame as a whole is bright
+    assert _reason(image, (0, 200, 100, 100)) == 'too_dark'
+
+
+def test_rolled_face_is_rejected(app, monkeypatch):
+    # Eye line at 45 degrees
+    _landmarks(monkeypatch, (30, 30), (70, 70), (40, 60))
+
+    assert _reason(_rgb(_textured())) == 'bad_pose'
+
+
+def test_roll_ignores_eye_order(app, monkeypatch):
+    # Eyes swapped: the eye line points at 180 degrees, which is level
+    _landmarks(monkeypatch, (70, 40), (30, 40), (50, 60))
+
+    assert _reason(_rgb(_textured())) is None
+
+
+def test_yawed_face_is_rejected(app, monkeypatch):
+    # Nose 20px off the eye midpoint with 40px between the eyes: yaw 0.5
+    _landmarks(monkeypatch, (30, 40), (70, 40), (70, 60))
+
+    assert _reason(_rgb(_textured())) == 'bad_pose'
+
+
+def test_coincident_eyes_are_bad_pose(app, monkeypatch):
+    _landmarks(monkeypatch, (50, 40), (50, 40), (50, 60))
+
+    assert _reason(_rgb(_textured())) == 'bad_pose'
@@ -0,0 +1,76 @@
+import threading
+import time
+
+import pytest
+
+from app.scheduler import EncodingScheduler, SchedulerBusy, \
+    PRIORITY_VERIFY, PRIORITY_REGISTER, PRIORITY_MAINTENANCE
+
+
+def _wait_for_queued(scheduler, count, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        queued = sum(c["queued"] for c in scheduler.metrics()["classes"].values())
+        if queued >= count:
+            return
+        time.sleep(0.005)
+    raise AssertionError(f"expected {count} queued tasks")
+
+
+def _start_waiter(scheduler, priority, kiosk_id, admitted):
+    def run():
+        scheduler.acquire(priority, kiosk_id)
+        admitted.append(priority)
+        scheduler.release(kiosk_id)
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+
+def test_waiters_are_admitted_by_priority_then_fifo():
+    scheduler = EncodingScheduler(workers=1, queue_timeout=5)
+    scheduler.acquire(PRIORITY_VERIFY, 'holder')
+
+    admitted = []
+    threads = []
+    for expected_queued, priority in enumerate(
+            [PRIORITY_MAINTENANCE, PRIORITY_REGISTER, PRIORITY_VERIFY], start=1):
+        threads.append(_start_waiter(scheduler, priority, f"kiosk{expected_queued}", admitted))
+        _wait_for_queued(scheduler, expected_queued)
+
+    scheduler.release('holder')
+    for thread in threads:
+        thread.join(timeout=5)
+
+    assert admitted == [PRIORITY_VERIFY, PRIORITY_REGISTER, PRIORITY_MAINTENANCE]
+
+
+def test_per_kiosk_limit_does_not_block_other_kiosks():
+    scheduler = EncodingScheduler(workers=4, per_kiosk=1, queue_timeout=0.05)
+    scheduler.acquire(PRIORITY_VERIFY, 'kiosk-a')
+
+    with pytest.raises(SchedulerBusy):
+        scheduler.acquire(PRIORITY_VERIFY, 'kiosk-a')
+    scheduler.acquire(PRIORITY_VERIFY, 'kiosk-b')
+
+    metrics = scheduler.metrics()
+    assert metrics["running"] == 2
+    assert metrics["classes"]["verify"]["rejected"] == 1
+
+
+def test_kiosk_slot_is_freed_on_release():
+    scheduler = EncodingScheduler(workers=4, per_kiosk=1, queue_timeout=0.05)
+    scheduler.run(PRIORITY_VERIFY, 'kiosk-a', lambda: None)
+    scheduler.acquire(PRIORITY_VERIFY, 'kiosk-a')
+    assert scheduler.metrics()["running"] == 1
+
+
+def test_reserved_slot_serves_verification_on_a_single_worker():
+    scheduler = EncodingScheduler(workers=1, reserved_verify=1, queue_timeout=0.05)
+    scheduler.acquire(PRIORITY_REGISTER, 'kiosk-a')
+
+    with pytest.raises(SchedulerBusy):
+        scheduler.acquire(PRIORITY_REGISTER, 'kiosk-b')
+    scheduler.acquire(PRIORITY_VERIFY, 'kiosk-c')
+    with pytest.raises(SchedulerBusy):
+        scheduler.acquire(PRIORITY_VERIFY, 'kiosk-d')
@@ -0,0 +1,91 @@
+import io
+import json
+
+import numpy as np
+import pytest
+
+pytest.importorskip('face_recognition')
+from app import create_app  # noqa: E402
+from config import Config  # noqa: E402
+from loadtest.fake_firestore import FakeFirestore  # noqa: E402
+
+DB = FakeFirestore()
+GUARDIAN = np.random.default_rng(0).normal(0, 0.1, 128)
+
+
+@pytest.fixture(scope='module')
+def app(tmp_path_factory):
+    # Routes bind the Firestore client on import, so the module shares one app
+    folder = tmp_path_factory.mktemp('uploads')
+
+    class TestConfig(Config):
+        UPLOAD_FOLDER = str(folder)
+        REFERENCE_FOLDER = str(folder / 'reference')
+        VERIFIED_FOLDER = str(folder / 'verified')
+        PICKUP_DEBOUNCE_SECONDS = 120
+    return create_app(TestConfig, firestore_client=DB)
+
+
+@pytest.fixture
+def client(app, monkeypatch):
+    DB.data.clear()
+    DB.apply_set('students', 's1', {"name": "Kid", "teacher_email": "t@x", "guardian_ids": []})
+    app.extensions.pop('pickup_idempotency', None)  # forget earlier pickups
+    return app.test_client()
+
+
+def _set_guardian(guardian_id, encoding):
+    DB.apply_set('guardians', guardian_id, {
+        "name": guardian_id, "_face_encoding": json.dumps(list(encoding)),
+        "student_ids": ['s1']})
+
+
+def _faces(monkeypatch, *faces):
+    """Makes the frame contain the given (encoding, reason) faces."""
+    detected = [{"location": (0, 100 * (i + 1), 100, 100 * i), "encoding": encoding,
+                 "reason": reason} for i, (encoding, reason) in enumerate(faces)]
+    from app import routes  # registered by create_app
+    monkeypatch.setattr(routes, 'get_face_encodings', lambda path: [dict(f) for f in detected])
+
+
+def _verify(client):
+    return client.post('/verify_pickup_multi',
+                       data={'image': (io.BytesIO(b'frame'), 'frame.png')})
+
+
+def test_repeat_match_reports_the_first_pickup_as_duplicate(client, monkeypatch):
+    _set_guardian('g1', GUARDIAN.tolist())
+    _faces(monkeypatch, (GUARDIAN, None))
+
+    first = _verify(client).get_json()
+    second = _verify(client)
+
+    body = second.get_json()
+    assert second.status_code == 200
+    assert first["faces"][0]["duplicate"] is False
+    assert body["faces"][0]["duplicate"] is True
+    assert body["faces"][0]["pickup_log_time"] == first["pickup_log_time"]
+    assert body["pickup_log_time"] == first["pickup_log_time"]
+    assert body["duplicate"] is True
+    assert len(DB.data['pickuplogs']) == 1
+
+
+def test_all_faces_failing_quality_is_unprocessable(client, monkeypatch):
+    _set_guardian('g1', GUARDIAN.tolist())
+    _faces(monkeypatch, (None, 'too_blurry'), (None, 'too_dark'))
+
+    response = _verify(client)
+
+    assert response.status_code == 422
+    assert [f["reason"] for f in response.get_json()["faces"]] == ['too_blurry', 'too_dark']
+
+
+def test_malformed_stored_encoding_does_not_break_matching(client, monkeypatch):
+    _set_guardian('broken', [0.1, 0.2, 0.3])
+    _set_guardian('g1', GUARDIAN.tolist())
+    _faces(monkeypatch, (GUARDIAN, None))
+
+    response = _verify(client)
+
+    assert response.status_code == 200
+    assert response.get_json()["faces"][0]["guardian_id"] == 'g1'
@@ -54,6 +54,24 @@ const Registration = () => {
         }
     }
 
+    // Poll a background registration job until it finishes, giving up after jobPollMaxAttempts
+    const pollJob = async (jobId) => {
+        const { jobPollIntervalMs, jobPollMaxAttempts } = config.api;
+        for (let attempt = 0; attempt < jobPollMaxAttempts; attempt++) {
+            await new Promise(resolve => setTimeout(resolve, jobPollIntervalMs));
+            const { data: job } = await axios.get(`${config.api.baseUrl}/jobs/${jobId}`);
+            if (job.status === 'succeeded') {
+                return job.result;
+            }
+            if (job.status === 'failed') {
+                const error = new Error((job.result && job.result.error) || 'Registration failed.');
+                error.response = { data: job.result || {}, statusText: `HTTP ${job.http_status}` };
+                throw error;
+            }
+        }
+        throw new Error(`still processing after ${jobPollMaxAttempts * jobPollIntervalMs / 1000} s; check the guardian list later.`);
+    };
+
     const capture = useCallback(() => {
         if (!webcamRef.current) return;
         const imageSrc = webcamRef.current.getScreenshot();
@@ -143,13 +161,19 @@ const Registration = () => {
         setRegistrationResult(null);
 
         try {
+            // Ask for a background job so the request only lasts for the upload
             const response = await axios.post(`${config.api.baseUrl}/register_guardian`, formData, {
                 headers: {
-                    'Content-Type': 'multipart/form-data'
+                    'Content-Type': 'multipart/form-data',
+                    'Prefer': 'respond-async'
                 }
             });
-            setRegistrationResult(response.data);
-            console.log("Registration response:", response.data);
+            let result = response.data;
+            if (response.status === 202) {
+                result = await pollJob(result.job_id);
+            }
+            setRegistrationResult(result);
+            console.log("Registration response:", result);
             // Optionally clear form on success
             // setGuardianName('');
             // setImgSrc(null);
@@ -8,6 +8,9 @@ const Verification = () => {
     const [imgSrc, setImgSrc] = useState(null);
     const [verificationResult, setVerificationResult] = useState(null);
     const [error, setError] = useState('');
+    // One idempotency key per captured image, so resubmitting the same capture
+    // does not log the pickup twice
+    const [captureKey, setCaptureKey] = useState(null);
     const [loading, setLoading] = useState(false);
 
     // Use videoConstraints from config
@@ -39,6 +42,7 @@ const Verification = () => {
         const imageSrc = webcamRef.current.getScreenshot();
         if (imageSrc) {
             setImgSrc(imageSrc);
+            setCaptureKey(`${Date.now()}-${Math.random().toString(36).slice(2)}`);
             setVerificationResult(null); // Clear previous results
             setError(''); // Clear previous errors
         } else {
@@ -70,7 +74,8 @@ const Verification = () => {
             // Use API URL from config
             const response = await axios.post(`${config.api.baseUrl}/verify_pickup`, formData, {
                 headers: {
-                    'Content-Type': 'multipart/form-data'
+                    'Content-Type': 'multipart/form-data',
+                    ...(captureKey && { 'Idempotency-Key': captureKey })
                 }
             });
             setVerificationResult(response.data);
@@ -6,6 +6,9 @@ const config = {
         // Check for environment variable first, then use the current hostname with port 5000
         baseUrl: process.env.REACT_APP_API_URL ||
             `http://${window.location.hostname}:5000`,
+        // Polling of background jobs (e.g. async guardian registration)
+        jobPollIntervalMs: 1000,
+        jobPollMaxAttempts: 120,
     },
 
     // Image settings